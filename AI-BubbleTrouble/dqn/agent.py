@@ -1,6 +1,7 @@
-import random
+import numpy as np
 import torch
-from memory import PrioritizedReplayBuffer
+from memory import PrioritizedReplayBuffer, FrameStorage, MemmapFrameStorage
+from checkpoint import ReplayCheckpoint
 from itertools import count
 from qvalues import QValues
 import project_utils
@@ -18,50 +19,93 @@ class Agent:
 
     def __init__(self, policy_net, target_net, strategy, em, test_em, num_actions, optimizer):
         self.curr_step = 0
+        # Number of transitions played in training, as curr_step counts the selected actions, the target net is
+        # updated every TARGET_UPDATE of them
+        self.num_steps = 0
         self.rate = 0
         self.strategy = strategy
         self.num_actions = num_actions
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.policy_net, self.target_net = policy_net, target_net
-        self.memory = PrioritizedReplayBuffer(MEMORY_SIZE)
+        self.scale = 0.7
+        if REPLAY_DIR is None:
+            storage, priorities = FrameStorage(MEMORY_SIZE, em.stack_size, em.packed_frames, em.num_envs), None
+        else:
+            # Resumes the replay buffer of a previous run from the same directory
+            storage = MemmapFrameStorage(REPLAY_DIR, MEMORY_SIZE, em.stack_size, REPLAY_CACHE_SIZE,
+                                         em.packed_frames, em.num_envs)
+            priorities = storage.priorities
+        self.memory = PrioritizedReplayBuffer(MEMORY_SIZE, priority_scale=self.scale, storage=storage,
+                                              priorities=priorities)
+        self.checkpoint = None if REPLAY_CHECKPOINT_DIR is None else ReplayCheckpoint(REPLAY_CHECKPOINT_DIR)
         self.optimizer = optimizer
         self.em = em
         self.test_em = test_em
-        self.scale = 0.7
 
-    def select_action(self, state, actions):
+    def save_replay(self):
+        """
+        Save the replay memory and the step counters to REPLAY_CHECKPOINT_DIR, written in the background
+        """
+        self.checkpoint.save(self.memory, curr_step=self.curr_step, num_steps=self.num_steps)
+
+    def load_replay(self):
+        """
+        Load the replay memory and the step counters saved by save_replay, to resume training
+        """
+        counters = self.checkpoint.load(self.memory)
+        self.curr_step, self.num_steps = counters['curr_step'], counters['num_steps']
+
+    def select_action(self, state, legal_mask):
         """
-        This method is given state and actions that can be taken from this state
-        then sample randomly number k in (0,1].
-        if rate > k samples randomly number from the given actions  and returns it
-        else returns the action with the highest q-value from the given actions
-
-        :param state: Tensor
-        :param actions: list of int - action space for the given state
-        :return: int - selected action
+        This method is given a batch of states and the masks of the actions that can be taken from them
+        then samples for every state a number k in [0,1).
+        if rate > k samples uniformly one of the legal actions of the state
+        else takes the legal action with the highest q-value.
+        The policy net is not run when all the states explore
+
+        :param state: Tensor - batch of states
+        :param legal_mask: bool Tensor of shape (batch, num_actions) - True for the legal actions of every state
+        :return: int - selected action of a single state, array of the selected actions of a batch
         """
         self.rate = self.strategy.get_exploration_rate(self.curr_step)
-        self.curr_step += 1
-        if self.rate > random.random():
-            return random.choice(actions)
+        batch_size = legal_mask.shape[0]
+        self.curr_step += batch_size
+        explore = torch.rand(batch_size) < self.rate
+        if explore.all():
+            actions = self._random_actions(legal_mask)
         else:
-            with torch.no_grad():
-                return self.policy_step(state, actions)
+            actions = self._greedy_actions(state, legal_mask)
+            if explore.any():
+                actions = torch.where(explore.to(actions.device), self._random_actions(legal_mask), actions)
+        return self._to_env_actions(actions)
 
-    def policy_step(self, state, actions):
+    def policy_step(self, state, legal_mask):
         """
-        This method is given state and actions that can be taken from this state and returns
-        the action with the highest q-value from the given actions
-        :param state: Tensor
-        :param actions: list of int - action space for the given state
-        :return: int - selected action
+        This method is given a batch of states and the masks of the actions that can be taken from them and
+        returns the action with the highest q-value of the legal actions of every state
+        :param state: Tensor - batch of states
+        :param legal_mask: bool Tensor of shape (batch, num_actions) - True for the legal actions of every state
+        :return: int - selected action of a single state, array of the selected actions of a batch
         """
+        return self._to_env_actions(self._greedy_actions(state, legal_mask))
+
+    def _greedy_actions(self, state, legal_mask):
+        # Masked argmax, the illegal actions can never have the highest q-value
         with torch.no_grad():
             output = self.policy_net(state.to(self.device))
-            top = output.topk(4).indices[0].cpu().numpy()
-            for act in top:
-                if act in actions:
-                    return act
+            return output.masked_fill(~legal_mask.to(output.device), float('-inf')).argmax(dim=1)
+
+    @staticmethod
+    def _random_actions(legal_mask):
+        # Uniform sample of the legal actions of every state
+        return torch.multinomial(legal_mask.float(), 1).squeeze(1)
+
+    @staticmethod
+    def _to_env_actions(actions):
+        # The only host sync of the action selection
+        if len(actions) == 1:
+            return actions.item()
+        return actions.cpu().numpy()
 
     def test(self, n_episodes):
         """
@@ -75,7 +119,7 @@ class Agent:
             total_reward = 0.0
             for _ in count():
 
-                action = self.policy_step(state, self.test_em.get_legal_actions())
+                action = self.policy_step(state, self.test_em.get_legal_mask())
                 next_state, reward, done, info = self.test_em.step(action)
                 total_reward += reward
                 state = next_state
@@ -91,45 +135,61 @@ class Agent:
 
     def train(self, num_episodes):
         """
-        This method is given the number of episides to train the model and trains it
+        This method is given the number of episides to train the model and trains it.
+        With several envs every step pushes the transition of every env to the memory and an episode is
+        finished whenever one of the envs is done, the envs that are done start their next episode by themselves
         :param num_episodes: number of episodes to train the model
         """
-        num_steps = cum_reward = max_reward_train = 0
+        num_envs = self.em.num_envs
+        max_reward_train = 0
         episode_reward = []
         episode_loss = []
-
-        for episode in range(num_episodes):
-
-            state = self.em.reset()
-            cum_loss = 0
-
-            for time_step in count():
-
-                num_steps += 1
-                action = self.select_action(state, self.em.get_legal_actions())
-                next_state, reward, done, _ = self.em.step(action)
-                reward = torch.tensor([reward], device=self.device)
-                self.memory.push(project_utils.Experience(state, action, next_state, reward, done))
-                state = next_state
-                cum_reward += reward.item()
-
-                if self.memory.can_provide_sample(BATCH_SIZE):
-                    cum_loss = self._train_step(cum_loss)
-
-                if num_steps % TARGET_UPDATE == 0:
-                    # Update the target net
-                    self.target_net.load_state_dict(self.policy_net.state_dict())
-
-                if self.em.done:
-                    max_reward_train = max(max_reward_train, cum_reward)
-                    episode_reward.append(cum_reward)
-                    mean_loss = cum_loss / (time_step + 1)
-                    episode_loss.append(mean_loss)
-                    project_utils.plot(episode_reward, 20, 'Reward')
-                    project_utils.plot(episode_loss, 20, 'Loss')
-                    if is_ipython: display.clear_output(wait=True)
-                    cum_reward = 0
-                    break
+        # Reward, loss and number of steps of the current episode of every env
+        cum_reward = np.zeros(num_envs)
+        cum_loss = np.zeros(num_envs)
+        episode_steps = np.zeros(num_envs, dtype=np.int64)
+        finished = 0
+        state = self.em.reset()
+
+        while finished < num_episodes:
+
+            self.num_steps += num_envs
+            action = self.select_action(state, self.em.get_legal_mask())
+            next_state, reward, done, _ = self.em.step(action)
+            actions, rewards, dones = np.atleast_1d(action), np.atleast_1d(reward), np.atleast_1d(done)
+            for env in range(num_envs):
+                env_reward = torch.tensor([float(rewards[env])], device=self.device)
+                self.memory.push(project_utils.Experience(state[env:env + 1], int(actions[env]),
+                                                          next_state[env:env + 1], env_reward, bool(dones[env])), env)
+            cum_reward += rewards
+            episode_steps += 1
+
+            if self.memory.can_provide_sample(BATCH_SIZE):
+                cum_loss = self._train_step(cum_loss)
+
+            if self.num_steps // TARGET_UPDATE != (self.num_steps - num_envs) // TARGET_UPDATE:
+                # Update the target net once TARGET_UPDATE more transitions were played
+                self.target_net.load_state_dict(self.policy_net.state_dict())
+
+            for env in np.flatnonzero(dones).tolist():
+                max_reward_train = max(max_reward_train, cum_reward[env])
+                episode_reward.append(cum_reward[env])
+                episode_loss.append(cum_loss[env] / episode_steps[env])
+                cum_reward[env] = cum_loss[env] = episode_steps[env] = 0
+                finished += 1
+                if self.checkpoint is not None and finished % REPLAY_SAVE_EVERY == 0:
+                    self.save_replay()
+            if dones.any():
+                project_utils.plot(episode_reward, 20, 'Reward')
+                project_utils.plot(episode_loss, 20, 'Loss')
+                if is_ipython: display.clear_output(wait=True)
+                if num_envs == 1:
+                    # A single env is not reset by itself
+                    next_state = self.em.reset()
+            state = next_state
+
+        if self.checkpoint is not None:
+            self.checkpoint.wait()
 
     def _train_step(self, cum_loss):
 
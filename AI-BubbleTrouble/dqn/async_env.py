@@ -0,0 +1,142 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory, resource_tracker
+
+import gym
+import numpy as np
+
+from legal_actions import get_legal_mask
+
+# Commands sent to the workers
+RESET = 'reset'
+STEP = 'step'
+ATTACH = 'attach'
+CLOSE = 'close'
+
+
+def _worker(index, env_fn, seed, pipe, parent_pipe):
+    # Runs a single env in a subprocess and writes its observations into row index of the shared array
+    parent_pipe.close()
+    env = env_fn()
+    env.unwrapped.seed(seed)
+    obs = env.reset()
+    pipe.send((obs.shape, obs.dtype.str))
+    memory, observation = None, None
+    try:
+        while True:
+            command, data = pipe.recv()
+            if command == STEP:
+                obs, reward, done, info = env.step(data)
+                if done:
+                    obs = env.reset()
+                observation[...] = obs
+                pipe.send((reward, done, get_legal_mask(env)))
+            elif command == RESET:
+                observation[...] = env.reset(**data)
+                pipe.send(get_legal_mask(env))
+            elif command == ATTACH:
+                memory = shared_memory.SharedMemory(name=data)
+                # The memory is owned and unlinked by the parent, attaching to it must not track it again
+                resource_tracker.unregister(memory._name, 'shared_memory')
+                observation = np.ndarray(obs.shape, dtype=obs.dtype, buffer=memory.buf, offset=index * obs.nbytes)
+                observation[...] = obs
+                pipe.send(get_legal_mask(env))
+            elif command == CLOSE:
+                break
+    finally:
+        observation = None
+        if memory is not None:
+            memory.close()
+        env.close()
+        pipe.close()
+
+
+class AsyncBubbleTroubleEnv:
+    """
+    K Bubble Trouble envs stepped in parallel, each in its own subprocess.
+    The observations of all the workers are written into a single shared memory array and only the
+    actions, rewards, dones and legal action masks go through the pipes. Envs that are done are reset automatically
+    """
+
+    def __init__(self, env_fn, num_envs, seed=None, context=None):
+        """
+        :param env_fn: picklable function that creates a BubbleTroubleEnv, possibly wrapped
+        :param num_envs: int - number of workers
+        :param seed: int - worker i seeds its env with seed + i
+        :param context: start method of the workers, the default of multiprocessing if not given
+        """
+        ctx = mp.get_context(context)
+        self.num_envs = num_envs
+        self.action_space = gym.spaces.Discrete(4)
+        self.pipes = []
+        self.processes = []
+        for index in range(num_envs):
+            pipe, worker_pipe = ctx.Pipe()
+            worker_seed = None if seed is None else seed + index
+            process = ctx.Process(target=_worker, args=(index, env_fn, worker_seed, worker_pipe, pipe), daemon=True)
+            process.start()
+            worker_pipe.close()
+            self.pipes.append(pipe)
+            self.processes.append(process)
+
+        specs = [pipe.recv() for pipe in self.pipes]
+        if len(set(specs)) != 1:
+            raise ValueError('All the envs must have the same observation shape and type, got {}'.format(specs))
+        shape, dtype = specs[0]
+        shape, dtype = (num_envs,) + tuple(shape), np.dtype(dtype)
+        self.memory = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * dtype.itemsize)
+        self.observations = np.ndarray(shape, dtype=dtype, buffer=self.memory.buf)
+        self.legal_masks = np.zeros((num_envs, self.action_space.n), dtype=bool)
+        self.legal_masks[:] = self._broadcast(ATTACH, self.memory.name)
+        self.closed = False
+
+    def _broadcast(self, command, data):
+        for pipe in self.pipes:
+            pipe.send((command, data))
+        return [pipe.recv() for pipe in self.pipes]
+
+    def reset(self, **kwargs):
+        """
+        Reset all the envs
+        :return: observations of all the envs, the shared array that is overwritten by the next step
+        """
+        self.legal_masks[:] = self._broadcast(RESET, kwargs)
+        return self.observations
+
+    def step(self, actions):
+        """
+        Execute a single step of all the envs, the returned observation of an env that is done is the first
+        observation of its next episode
+        :param actions: int array of shape (K,) - action of every env
+        :return: observations (the shared array), rewards (K,), dones (K,), infos
+        """
+        for pipe, action in zip(self.pipes, actions):
+            pipe.send((STEP, int(action)))
+        results = [pipe.recv() for pipe in self.pipes]
+        rewards, dones, legal_masks = zip(*results)
+        self.legal_masks[:] = legal_masks
+        return self.observations, np.array(rewards), np.array(dones), [{} for _ in range(self.num_envs)]
+
+    def get_legal_actions(self):
+        """
+        :return: list of the legal actions of every env, as given by legal_actions.get_legal_actions
+        """
+        return [np.flatnonzero(mask).tolist() for mask in self.legal_masks]
+
+    def get_legal_masks(self):
+        """
+        :return: bool array of shape (K, num_actions) - the legal action masks of all the envs, overwritten
+        by the next step
+        """
+        return self.legal_masks
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for pipe in self.pipes:
+            pipe.send((CLOSE, None))
+        for process in self.processes:
+            process.join()
+        self.observations = None
+        self.memory.close()
+        self.memory.unlink()
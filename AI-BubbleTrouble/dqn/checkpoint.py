@@ -0,0 +1,212 @@
+import json
+import os
+import queue
+import threading
+import zlib
+
+import numpy as np
+
+from memory import FRAME_COUNT
+
+MANIFEST_FILE = 'manifest.json'
+# Size in bytes of the uncompressed data of a chunk
+CHUNK_BYTES = 2 ** 22
+COMPRESSION_LEVEL = 1
+
+# Arrays of a FrameStorage with a row per transition
+TRANSITION_ARRAYS = ('actions', 'rewards', 'dones', 'numbers', 'starts')
+
+
+def _chunk_file(name, chunk, version):
+    return '{}-{}-{}.z'.format(name, chunk, version)
+
+
+class ReplayCheckpoint:
+    """
+    Saves a PrioritizedReplayBuffer over a FrameStorage, with counters of the agent, to a directory of
+    zlib compressed chunks and loads it back.
+    Every array is cut into chunks of about CHUNK_BYTES and a save writes only the chunks changed since
+    the previous save or load, copied while save is called and compressed and written by a background
+    thread. The manifest that lists the chunks of a checkpoint is replaced last, so a save that was
+    interrupted leaves the previous checkpoint whole. A checkpoint is loaded into the arrays of a
+    storage chunk by chunk, into the files of a MemmapFrameStorage it is memory mapped
+    """
+
+    def __init__(self, directory, chunk_bytes=CHUNK_BYTES, level=COMPRESSION_LEVEL):
+        """
+        :param directory: directory of the checkpoint, created if it does not exist
+        :param chunk_bytes: int - size in bytes of the uncompressed data of a chunk
+        :param level: int - zlib compression level
+        """
+        self.directory = directory
+        self.chunk_bytes = chunk_bytes
+        self.level = level
+        os.makedirs(directory, exist_ok=True)
+        # Number of transitions of the storage and numbers of frames of its streams that the checkpoint on disk
+        # holds, None when unknown
+        self.saved_counts = None
+        self.version = 0
+        self.manifest = None
+        self.error = None
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def exists(self):
+        """
+        :return: True if the directory holds a complete checkpoint
+        """
+        return os.path.exists(os.path.join(self.directory, MANIFEST_FILE))
+
+    def _read_manifest(self):
+        with open(os.path.join(self.directory, MANIFEST_FILE)) as manifest_file:
+            return json.load(manifest_file)
+
+    def _chunk_rows(self, array):
+        # Number of rows of the array in a chunk
+        return max(self.chunk_bytes // max(array[:1].nbytes, 1), 1)
+
+    def _dirty_rows(self, storage):
+        # Rows of the transition and frame arrays written since the checkpoint on disk
+        if self.saved_counts is None:
+            return np.arange(storage.capacity), np.arange(storage.num_frames)
+        saved_count, saved_frame_counts = self.saved_counts
+        count, frame_counts = storage.count, storage.streams[:, FRAME_COUNT]
+        if count - saved_count >= storage.capacity:
+            transitions = np.arange(storage.capacity)
+        else:
+            transitions = np.arange(saved_count, count) % storage.capacity
+        # Every frame is written once, under a number of its stream that was not written before
+        if (frame_counts - saved_frame_counts).sum() >= storage.num_frames:
+            frames = np.arange(storage.num_frames)
+        else:
+            ranges = zip(saved_frame_counts.tolist(), frame_counts.tolist())
+            frames = np.concatenate([np.arange(saved, frame_count) * storage.num_streams + stream
+                                     for stream, (saved, frame_count) in enumerate(ranges)])
+            frames %= storage.num_frames
+        return transitions, frames
+
+    @staticmethod
+    def _counts(storage):
+        return storage.count, storage.streams[:, FRAME_COUNT].copy()
+
+    def save(self, buffer, **counters):
+        """
+        Save the buffer in the background, the changed chunks are copied before save returns
+        :param buffer: PrioritizedReplayBuffer over a FrameStorage or a MemmapFrameStorage
+        :param counters: ints of the agent saved with the buffer
+        """
+        self._raise_error()
+        storage = buffer.storage
+        if storage.frames is None:
+            return
+        if self.saved_counts is None:
+            # The chunks of a checkpoint that the buffer was not loaded from are all replaced
+            files, chunk_rows = {}, {}
+            if self.exists():
+                self.version = self._read_manifest()['version']
+        else:
+            files = {name: dict(chunks) for name, chunks in self.manifest['files'].items()}
+            chunk_rows = dict(self.manifest['chunk_rows'])
+        transitions, frames = self._dirty_rows(storage)
+        arrays = [(name, getattr(storage, name), transitions) for name in TRANSITION_ARRAYS]
+        arrays.append(('frames', storage.frames, frames))
+        arrays.append(('priorities', buffer.priorities, np.arange(buffer.maxlen)))
+        copies = []
+        for name, array, rows in arrays:
+            size = chunk_rows.setdefault(name, self._chunk_rows(array))
+            for chunk in np.unique(rows // size).tolist():
+                copies.append((name, chunk, np.array(array[chunk * size:(chunk + 1) * size])))
+        self.version += 1
+        for name, chunk, _ in copies:
+            files.setdefault(name, {})[str(chunk)] = _chunk_file(name, chunk, self.version)
+        self.manifest = {
+            'version': self.version,
+            'capacity': storage.capacity,
+            'stack_size': storage.stack_size,
+            'packed': storage.packed,
+            'num_streams': storage.num_streams,
+            'chunk_rows': chunk_rows,
+            'frame_shape': list(storage.frame_shape),
+            'frame_dtype': storage.frame_dtype.str,
+            'storage_counters': storage.counters.tolist(),
+            'streams': storage.streams.tolist(),
+            'counters': counters,
+            'files': files,
+        }
+        self.saved_counts = self._counts(storage)
+        self.queue.put((copies, self.manifest))
+
+    def _write_loop(self):
+        while True:
+            copies, manifest = self.queue.get()
+            try:
+                if self.error is None:
+                    self._write(copies, manifest)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def _write(self, copies, manifest):
+        # zlib releases the GIL while it compresses, so training goes on while the chunks are written
+        for name, chunk, data in copies:
+            path = os.path.join(self.directory, _chunk_file(name, chunk, manifest['version']))
+            with open(path, 'wb') as chunk_file:
+                chunk_file.write(zlib.compress(data.tobytes(), self.level))
+        manifest_path = os.path.join(self.directory, MANIFEST_FILE)
+        with open(manifest_path + '.tmp', 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(manifest_path + '.tmp', manifest_path)
+        # The chunks that no checkpoint refers to any more
+        current = {file for chunks in manifest['files'].values() for file in chunks.values()}
+        for file in os.listdir(self.directory):
+            if file.endswith('.z') and file not in current:
+                os.remove(os.path.join(self.directory, file))
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            # The chunks of the failed saves may be missing, the next save writes them all
+            self.saved_counts = None
+            raise error
+
+    def wait(self):
+        """
+        Wait until all the saves are written
+        """
+        self.queue.join()
+        self._raise_error()
+
+    def load(self, buffer):
+        """
+        Load the checkpoint into the given buffer, its storage must have the capacity, stack size, packing and
+        number of streams the checkpoint was saved with
+        :param buffer: PrioritizedReplayBuffer over a FrameStorage or a MemmapFrameStorage
+        :return: dict of the counters of the agent given to save
+        """
+        self.wait()
+        manifest = self._read_manifest()
+        storage = buffer.storage
+        layout = [manifest[name] for name in ('capacity', 'stack_size', 'packed', 'num_streams')]
+        if layout != [storage.capacity, storage.stack_size, storage.packed, storage.num_streams]:
+            raise ValueError('{} holds a checkpoint of capacity {}, stack size {}, packed {} and {} streams'.format(
+                self.directory, *layout))
+        frame_shape, frame_dtype = tuple(manifest['frame_shape']), np.dtype(manifest['frame_dtype'])
+        if storage.frames is None:
+            storage._allocate_frames(frame_shape, frame_dtype)
+        arrays = {name: getattr(storage, name) for name in TRANSITION_ARRAYS}
+        arrays.update(frames=storage.frames, priorities=buffer.priorities)
+        for name, chunks in manifest['files'].items():
+            array, size = arrays[name], manifest['chunk_rows'][name]
+            for chunk, file in chunks.items():
+                with open(os.path.join(self.directory, file), 'rb') as chunk_file:
+                    data = np.frombuffer(zlib.decompress(chunk_file.read()), dtype=array.dtype)
+                rows = array[int(chunk) * size:(int(chunk) + 1) * size]
+                rows[...] = data.reshape(rows.shape)
+        storage.counters[:] = manifest['storage_counters']
+        storage.streams[:] = manifest['streams']
+        buffer.rebuild_trees()
+        self.manifest, self.version = manifest, manifest['version']
+        self.saved_counts = self._counts(storage)
+        return manifest['counters']
@@ -5,16 +5,32 @@ import cv2 as cv
 import random
 import time
 from bubbletrouble.game import BubbleTroubleGame
+from bubbletrouble.start_states import StartStatePool
 import pygame
 from pygame.locals import K_LEFT, K_RIGHT, K_SPACE, K_ESCAPE, KEYUP, KEYDOWN, QUIT
 from parameters import *
-from project_utils import get_euclidian_closest_bubble, get_x_axis_closest_bubble
+from spatial import BubbleQuery, AXIS_X
+from rasterizer import Rasterizer
+from features import FEATURE_SIZE, encode_game
+from planes import PlaneRenderer, NUM_PLANES
 
 ACTION_LEFT = 0
 ACTION_RIGHT = 1
 ACTION_FIRE = 2
 ACTION_IDLE = 3
 
+# Observation types, the drawn screen resized to (HEIGHT, WIDTH), the same image rasterized from the game state,
+# the float32 vector of features.encode_game or the binary planes of planes.PlaneRenderer
+OBS_PIXELS = 'pixels'
+OBS_RASTER = 'raster'
+OBS_FEATURES = 'features'
+OBS_PLANES = 'planes'
+OBS_TYPES = (OBS_PIXELS, OBS_RASTER, OBS_FEATURES, OBS_PLANES)
+
+# Fixed point weights of the red, green and blue channels in cv.COLOR_RGB2GRAY
+GRAY_WEIGHTS = np.array([9798, 19235, 3735], dtype=np.uint32)
+GRAY_SHIFT = 15
+
 T_LIMIT = 45
 MAX_N_STEPS = FPS * T_LIMIT
 
@@ -27,22 +43,56 @@ K = 1
 class BubbleTroubleEnv(gym.Env):
     metadata = {'render.modes': ['rgb_array']}
 
-    def __init__(self, rewards=None):
+    def __init__(self, rewards=None, headless=False, obs_type=OBS_PIXELS, copy_obs=True, start_variants=0):
+        """
+        :param rewards: dict - reward of every event, DEFAULT_REWARDS if not given
+        :param headless: every env draws the game to its own offscreen surface, unless headless the surface
+        is also shown on the display, which is shared by all the envs of the process, and steps are limited to FPS
+        :param obs_type: one of OBS_TYPES, unless it is OBS_PIXELS a headless game is drawn only by render
+        :param copy_obs: if False the observations are the buffer of the env, overwritten by the next step
+        :param start_variants: number of jittered start states of every level, reset picks one of them at random
+        """
+        if obs_type not in OBS_TYPES:
+            raise ValueError('obs_type must be one of {}'.format(OBS_TYPES))
         pygame.init()
+        self.obs_type = obs_type
+        self.rasterizer = Rasterizer() if obs_type == OBS_RASTER else None
+        self.plane_renderer = PlaneRenderer() if obs_type == OBS_PLANES else None
+        self.copy_obs = copy_obs
+        if obs_type == OBS_FEATURES:
+            self.observation = np.zeros(FEATURE_SIZE, dtype=np.float32)
+        elif obs_type == OBS_PLANES:
+            self.observation = np.zeros((HEIGHT, WIDTH, NUM_PLANES), dtype=np.uint8)
+        else:
+            self.observation = np.zeros((HEIGHT, WIDTH, 1), dtype=np.uint8)
+        self._gray = np.zeros((WINDOWHEIGHT, WINDOWWIDTH), dtype=np.uint8)
+        self._gray_sum = np.zeros((WINDOWHEIGHT, WINDOWWIDTH), dtype=np.uint32)
+        self._gray_term = np.zeros((WINDOWHEIGHT, WINDOWWIDTH), dtype=np.uint32)
         self.rewards = rewards if rewards else DEFAULT_REWARDS
         self.action_space = gym.spaces.Discrete(4)
         self.n_steps = 0
         self.previous_score = None
         self.game = None
-        self.closest_dist_euc, self.closest_ball_euc = 0, None
-        self.closest_dist, self.closest_ball = 0, None
+        self.start_pool = StartStatePool(variants=start_variants)
+        self._bubble_query = None
 
         # Init game
+        self.headless = headless
+        self.is_drawn = False
         self.clock = pygame.time.Clock()
         self.font = pygame.font.SysFont('monospace', 30)
-        self.screen = pygame.display.set_mode((WINDOWWIDTH, WINDOWHEIGHT), pygame.DOUBLEBUF)
-        pygame.display.set_caption('Bubble Trouble')
-        self.surface = pygame.Surface((WINDOWWIDTH, WINDOWHEIGHT), pygame.RESIZABLE).convert()
+        self.surface = pygame.Surface((WINDOWWIDTH, WINDOWHEIGHT), pygame.RESIZABLE)
+        self.screen = pygame.Surface((WINDOWWIDTH, WINDOWHEIGHT))
+        if not headless and pygame.display.get_surface() is None:
+            pygame.display.set_mode((WINDOWWIDTH, WINDOWHEIGHT), pygame.DOUBLEBUF)
+            pygame.display.set_caption('Bubble Trouble')
+
+    def seed(self, seed=None):
+        """
+        Seed the jittered start states and the random choice of them by reset
+        """
+        self.start_pool.seed(seed)
+        return [seed]
 
     def lives(self):
         """
@@ -62,33 +112,70 @@ class BubbleTroubleEnv(gym.Env):
         """
         return self.game.balls + self.game.hexagons
 
-    def _update_closest_ball(self):
-        # Update the closest ball and it's distance from the player
-        # One for euclidean distance and once for x axis distance
-        balls_list = self.get_ball_list()
-        if balls_list:
-            self.closest_ball, self.closest_dist = get_x_axis_closest_bubble(self.game, balls_list)
-            self.closest_ball_euc, self.closest_dist_euc = get_euclidian_closest_bubble(self.game, balls_list)
+    @property
+    def bubble_query(self):
+        """
+        :return: BubbleQuery of the current frame, built on the first query of the frame
+        """
+        if self._bubble_query is None:
+            self._bubble_query = BubbleQuery.from_game(self.game)
+        return self._bubble_query
+
+    @property
+    def closest_ball(self):
+        return self.bubble_query.closest(AXIS_X)[0]
+
+    @property
+    def closest_dist(self):
+        return self.bubble_query.closest(AXIS_X)[1]
+
+    @property
+    def closest_ball_euc(self):
+        return self.bubble_query.closest()[0]
 
-    def reset(self):
+    @property
+    def closest_dist_euc(self):
+        return self.bubble_query.closest()[1]
+
+    def reset(self, level=1):
         """
-        Reset the environment and returns the first observation
+        Reset the environment and returns the first observation.
+        The game is created once, every reset restores a start state of the given level into it
+        :param level: int - level to start from, in [1, MAX_LEVEL]
         """
         self.n_steps = 0
-        self.game = BubbleTroubleGame()
-        self.game.load_level(1)
+        if self.game is None:
+            self.game = BubbleTroubleGame()
+        self.game.restore(self.start_pool.sample(level))
+        self.game.reset_stats()
+        self.previous_score = self.game.score
+        self.is_drawn = False
+        self._bubble_query = None
+        return self.observe()
+
+    def restart_level(self):
+        """
+        Restart the current level in place after the player lost a life, the lives and score are kept
+        :return: the first observation of the restarted level
+        """
+        self.game.load_level(self.game.level)
         self.previous_score = self.game.score
+        self.is_drawn = False
+        self._bubble_query = None
+        self._prepare_observation()
         return self._get_processed_screen()
 
-    def step(self, action):
+    def step(self, action, observe=True):
         """
         Execute a single step of the game
         :param action: int - action to execute
+        :param observe: if False the step is not drawn nor observed and the returned observation is None,
+        for the steps skipped by the agent
         """
         self.n_steps += 1
-        self._make_single_step(action)
+        self._make_single_step(action, observe)
 
-        state = self._get_processed_screen()
+        state = self._get_processed_screen() if observe else None
         win = self.game.is_completed
         done = self.is_done()
         reward = self._fitness(action, not self.game.player.is_alive, win, self._is_ball_hit())
@@ -105,15 +192,48 @@ class BubbleTroubleEnv(gym.Env):
         """
         :return: current frame of the game
         """
+        if not self.is_drawn:
+            self.draw_world()
         image = pygame.surfarray.array3d(self.screen)
         return image.swapaxes(1, 2).transpose((2, 0, 1))
 
+    def observe(self):
+        """
+        :return: observation of the current state, for a step that was made without observing it
+        """
+        self._prepare_observation()
+        return self._get_processed_screen()
+
+    def _prepare_observation(self):
+        # Only the pixel observations are read from the screen, a headless game is otherwise drawn by render
+        if self.obs_type == OBS_PIXELS and not self.is_drawn:
+            self.draw_world()
+
+    def _capture_gray(self):
+        # Gray conversion of cv.COLOR_RGB2GRAY read through a view of the screen pixels, the view locks
+        # the screen so it is released before the next draw
+        pixels = pygame.surfarray.pixels3d(self.screen).transpose((1, 0, 2))
+        np.multiply(pixels[..., 0], GRAY_WEIGHTS[0], out=self._gray_sum)
+        for channel in (1, 2):
+            np.multiply(pixels[..., channel], GRAY_WEIGHTS[channel], out=self._gray_term)
+            self._gray_sum += self._gray_term
+        del pixels
+        self._gray_sum += 1 << (GRAY_SHIFT - 1)
+        self._gray_sum >>= GRAY_SHIFT
+        np.copyto(self._gray, self._gray_sum, casting='unsafe')
+        return self._gray
+
     def _get_processed_screen(self):
-        screen = self.render()
-        screen = cv.cvtColor(screen, cv.COLOR_RGB2GRAY)
-        screen = cv.resize(screen, (WIDTH, HEIGHT), interpolation=cv.INTER_AREA)
-        screen = np.expand_dims(screen, -1)
-        return screen
+        if self.obs_type == OBS_FEATURES:
+            encode_game(self.game, self.observation)
+        elif self.obs_type == OBS_PLANES:
+            self.plane_renderer.draw(self.game, out=self.observation)
+        elif self.obs_type == OBS_RASTER:
+            self.rasterizer.draw(self.game, out=self.observation[..., 0])
+        else:
+            cv.resize(self._capture_gray(), (WIDTH, HEIGHT), dst=self.observation[..., 0],
+                      interpolation=cv.INTER_AREA)
+        return self.observation.copy() if self.copy_obs else self.observation
 
     def close(self):
         self.game.exit_game()
@@ -136,19 +256,35 @@ class BubbleTroubleEnv(gym.Env):
         # True if an object is been destroyed and false otherwise
         return self.previous_score != self.game.score
 
-    def _make_single_step(self, action):
-        # Execute a single step of the game by drawing and updating the game image
+    def _make_single_step(self, action, observe=True):
+        # Execute a single step of the game by updating the game and drawing what is observed or displayed
         key = key_map[action]
         self.handle_key(key)
         self.game.update()
-        self.clock.tick(FPS)
-        pygame.display.update()
-        self.draw_world()
+        self.is_drawn = False
+        self._bubble_query = None
+        if not self.headless:
+            self.draw_world()
+            self.clock.tick(FPS)
+            self.show()
+        elif observe:
+            self._prepare_observation()
+
+    def show(self):
+        """
+        Copy the screen of this env to the display, the display shows the env that was shown last
+        """
+        display = pygame.display.get_surface()
+        if display is not None:
+            display.blit(self.screen, (0, 0))
+            pygame.display.update()
 
     def render_with_states(self):
 
         img = np.ascontiguousarray(self.render(), dtype=np.uint8)
         c_x = int(self.game.player.position())
+        if self.closest_ball_euc is None:
+            return img
         closest_ball = self.closest_ball_euc.rect
         x, y = int(closest_ball.centerx), int(closest_ball.centery)
         p1, p2 = closest_ball.topleft, closest_ball.bottomright
@@ -177,10 +313,10 @@ class BubbleTroubleEnv(gym.Env):
             self.draw_hex(hexagon)
         for ball in self.game.balls:
             self.draw_ball(ball)
-        self._update_closest_ball()
         if self.game.player.weapon.is_active:
             self.draw_weapon(self.game.player.weapon)
         self.draw_player(self.game.player)
+        self.is_drawn = True
 
     def draw_ball(self, ball):
         self.screen.blit(ball.image, ball.rect)
@@ -0,0 +1,82 @@
+import numpy as np
+
+from settings import *
+
+# Every bubble slot is (present, is_hexagon, center x, center y, speed x, speed y, size)
+BUBBLE_FEATURES = 7
+# The player is (center x, weapon is active, weapon top, time left)
+PLAYER_FEATURES = 4
+FEATURE_SIZE = MAX_BALLS_AT_ALL_TIME * BUBBLE_FEATURES + PLAYER_FEATURES
+
+SPEED_SCALE = 10.
+TIME_SCALE = 60. * FPS
+
+
+def encode_features(out, present, is_hexagon, left, top, extent, speed_x, speed_y,
+                    player_left, weapon_active, weapon_top, frames_left):
+    """
+    Encode a batch of game states into fixed size float32 feature vectors.
+    The bubble arrays have shape (N, S) where S is any number of slots, the present bubbles are packed
+    to the front in slot order and padded (or cut) to MAX_BALLS_AT_ALL_TIME, the player arrays have shape (N,)
+    :param out: float32 array of shape (N, FEATURE_SIZE), written in place
+    :param present: bool array - True for the slots that hold a bubble
+    :param is_hexagon: bool array - True for hexagons and false for balls
+    :param left: int array - x of the top left corner of every bubble
+    :param top: int array - y of the top left corner of every bubble
+    :param extent: int array - size in pixels of every bubble
+    :param speed_x: int array - horizontal speed of every bubble
+    :param speed_y: int array - vertical speed of every bubble
+    :param player_left: int array - x of the left side of the player
+    :param weapon_active: bool array - True if the player's weapon is in the air
+    :param weapon_top: int array - y of the top of the weapon
+    :param frames_left: int array - number of frames left to complete the level
+    :return: out
+    """
+    n_games, n_slots = present.shape
+    slots = min(n_slots, MAX_BALLS_AT_ALL_TIME)
+    order = np.argsort(~present, axis=1, kind='stable')[:, :slots]
+
+    def packed(values):
+        return np.take_along_axis(values, order, axis=1)
+
+    bubbles = out[:, :MAX_BALLS_AT_ALL_TIME * BUBBLE_FEATURES].reshape(n_games, MAX_BALLS_AT_ALL_TIME,
+                                                                       BUBBLE_FEATURES)
+    bubbles[:, slots:] = 0
+    extent = packed(extent)
+    mask = packed(present)
+    bubbles[:, :slots, 0] = mask
+    bubbles[:, :slots, 1] = packed(is_hexagon)
+    bubbles[:, :slots, 2] = (packed(left) + extent / 2) / WINDOWWIDTH
+    bubbles[:, :slots, 3] = (packed(top) + extent / 2) / WINDOWHEIGHT
+    bubbles[:, :slots, 4] = packed(speed_x) / SPEED_SCALE
+    bubbles[:, :slots, 5] = packed(speed_y) / SPEED_SCALE
+    bubbles[:, :slots, 6] = extent / (SIZE_TO_PIXELS * MAX_BALL_SIZE)
+    bubbles[:, :slots] *= mask[..., None]
+
+    player = out[:, MAX_BALLS_AT_ALL_TIME * BUBBLE_FEATURES:]
+    player[:, 0] = (player_left + PLAYER_SHAPE[1] / 2) / WINDOWWIDTH
+    player[:, 1] = weapon_active
+    player[:, 2] = np.where(weapon_active, weapon_top / WINDOWHEIGHT, 1.)
+    player[:, 3] = frames_left / TIME_SCALE
+    return out
+
+
+def encode_game(game, out):
+    """
+    Encode the state of a single BubbleTroubleGame, its balls are followed by its hexagons
+    :param game: BubbleTroubleGame
+    :param out: float32 array of shape (FEATURE_SIZE,), written in place
+    :return: out
+    """
+    game.sync_bubbles()
+    bubbles = game.balls + game.hexagons
+    rects = [bubble.rect for bubble in bubbles]
+    speeds = np.array([bubble.speed for bubble in bubbles], dtype=np.int64).reshape((1, -1, 2))
+    is_hexagon = np.arange(len(bubbles)) >= len(game.balls)
+    weapon = game.player.weapon
+    encode_features(out[None], np.ones((1, len(bubbles)), dtype=bool), is_hexagon[None],
+                    np.array([[rect.left for rect in rects]]), np.array([[rect.top for rect in rects]]),
+                    np.array([[rect.width for rect in rects]]), speeds[..., 0], speeds[..., 1],
+                    np.array([game.player.rect.left]), np.array([weapon.is_active]), np.array([weapon.rect.top]),
+                    np.array([game.clock.frames_left]))
+    return out
@@ -1,6 +1,7 @@
 import pygame
 
 from settings import *
+from assets import get_image, get_mask
 
 BONUS_LIFE = 'bonus life'
 BONUS_TIME = 'bonus time'
@@ -10,7 +11,8 @@ bonus_types = [BONUS_LIFE, BONUS_TIME]
 
 class Bonus(pygame.sprite.Sprite):
     def __init__(self, x, y, type):
-        self.image = pygame.image.load(IMAGES_PATH + type + '.png')
+        self.image = get_image(type + '.png')
+        self.mask = get_mask(type + '.png')
         self.rect = self.image.get_rect(centerx=x, centery=y)
         self.type = type
 
@@ -1,13 +1,14 @@
 import pygame
 
 from settings import *
+from assets import get_image, get_mask
 
 
 class Bubble(pygame.sprite.Sprite):
     def __init__(self, x, y, size, speed, image_name):
         pygame.sprite.Sprite.__init__(self)
-        self.image = pygame.image.load(IMAGES_PATH + image_name)
-        self.image = pygame.transform.scale(self.image, (size*SIZE_TO_PIXELS, size*SIZE_TO_PIXELS))
+        self.image = get_image(image_name, (size*SIZE_TO_PIXELS, size*SIZE_TO_PIXELS))
+        self.mask = get_mask(image_name, (size*SIZE_TO_PIXELS, size*SIZE_TO_PIXELS))
         self.rect = self.image.get_rect(centerx=x, centery=y)
         self.size = size
         self.speed = speed
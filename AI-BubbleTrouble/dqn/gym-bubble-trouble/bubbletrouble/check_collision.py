@@ -0,0 +1,48 @@
+import contextlib
+import io
+import sys
+
+import numpy as np
+
+from game import BubbleTroubleGame
+from collision import compare_with_masks
+
+NUM_GAMES = 20
+NUM_FRAMES = 2000
+
+
+def check_collision(seeds=range(NUM_GAMES), num_frames=NUM_FRAMES):
+    """
+    Play seeded games with random controls on the mask path and check the analytic path against the pixel masks
+    before every frame, a game that is over is replaced by a new one
+    :param seeds: seed of the controls of every game
+    :param num_frames: int - number of frames played with every seed
+    :return: (number of contacts found by any of the paths, number of disagreements, mask contacts missed)
+    """
+    totals = np.zeros(3, dtype=np.int64)
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        game = BubbleTroubleGame()
+        game.load_level(1)
+        # The game prints the lives of the player on every level change
+        with contextlib.redirect_stdout(io.StringIO()):
+            for control in rng.integers(4, size=num_frames):
+                if game.game_over or game.is_completed:
+                    game = BubbleTroubleGame()
+                    game.load_level(1)
+                if control < 2:
+                    game.move_player(2 * control - 1)
+                elif control == 2:
+                    game.fire_player()
+                else:
+                    game.stop_player()
+                totals += compare_with_masks(game)
+                game.update()
+    return tuple(totals.tolist())
+
+
+if __name__ == '__main__':
+    contacts, disagreements, missed = check_collision()
+    print('contacts: {}, disagreements: {}, missed mask contacts: {}'.format(contacts, disagreements, missed))
+    if missed:
+        sys.exit('the analytic collision path missed {} mask contacts'.format(missed))
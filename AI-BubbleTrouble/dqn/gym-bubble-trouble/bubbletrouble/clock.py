@@ -0,0 +1,44 @@
+from settings import FPS
+
+
+class LevelClock:
+    """
+    Level clock counted in game frames, the time left is derived from the frames at the game's FPS
+    so it advances with the simulation and not with the wall clock
+    """
+
+    def __init__(self, seconds=0, fps=FPS):
+        self.fps = fps
+        self.frames = 0
+        self.limit = 0
+        self.reset(seconds)
+
+    def reset(self, seconds):
+        """
+        Restart the clock with the given level time
+        :param seconds: int - time of the level in seconds
+        """
+        self.frames = 0
+        self.limit = int(seconds * self.fps)
+
+    def tick(self):
+        """
+        Advance the clock by a single frame
+        :return: True if the time ran out on this frame and false otherwise
+        """
+        self.frames += 1
+        return self.frames == self.limit
+
+    def add_time(self, seconds):
+        self.limit += int(seconds * self.fps)
+
+    @property
+    def frames_left(self):
+        return max(self.limit - self.frames, 0)
+
+    @property
+    def time_left(self):
+        """
+        :return: int - number of seconds left, rounded up
+        """
+        return -(-self.frames_left // self.fps)
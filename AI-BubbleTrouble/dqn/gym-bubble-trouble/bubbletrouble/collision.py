@@ -0,0 +1,92 @@
+import numpy as np
+
+from settings import *
+
+MASK = 'mask'
+ANALYTIC = 'analytic'
+COLLISION_MODES = (MASK, ANALYTIC)
+
+# Vertices of the hexagon image in units of its bounding square, (x, y) from the top left corner
+HEXAGON_VERTICES = np.array([[.5, 0.], [1., .25], [1., .75], [.5, 1.], [0., .75], [0., .25]])
+# Normals of the slanted edges of the hexagon, the vertical edges share the axes of the rectangle
+HEXAGON_AXES = np.array([[-.25, .5], [.25, .5]])
+# Projection of the hexagon vertices on every axis, as (min, max) per axis
+_HEXAGON_PROJECTIONS = [(projection.min(), projection.max()) for projection in HEXAGON_AXES @ HEXAGON_VERTICES.T]
+
+
+def circle_rect_overlap(center_x, center_y, radius, rect_left, rect_top, rect_right, rect_bottom):
+    """
+    Circle against axis aligned rectangle, works on scalars and on broadcastable arrays
+    :return: True where the circle and the rectangle overlap
+    """
+    dx = center_x - np.clip(center_x, rect_left, rect_right)
+    dy = center_y - np.clip(center_y, rect_top, rect_bottom)
+    return dx * dx + dy * dy < radius * radius
+
+
+def hexagon_rect_overlap(left, top, extent, rect_left, rect_top, rect_right, rect_bottom):
+    """
+    Separating axis test of the hexagon inscribed in the given square against an axis aligned rectangle,
+    works on scalars and on broadcastable arrays
+    :return: True where the hexagon and the rectangle overlap
+    """
+    overlap = (left < rect_right) & (left + extent > rect_left) & (top < rect_bottom) & (top + extent > rect_top)
+    for (axis_x, axis_y), (low, high) in zip(HEXAGON_AXES, _HEXAGON_PROJECTIONS):
+        base = left * axis_x + top * axis_y
+        rect_low = np.minimum(rect_left * axis_x, rect_right * axis_x) + \
+            np.minimum(rect_top * axis_y, rect_bottom * axis_y)
+        rect_high = np.maximum(rect_left * axis_x, rect_right * axis_x) + \
+            np.maximum(rect_top * axis_y, rect_bottom * axis_y)
+        overlap &= (base + low * extent < rect_high) & (rect_low < base + high * extent)
+    return overlap
+
+
+def bubble_rect_overlap(is_hexagon, left, top, extent, rect_left, rect_top, rect_right, rect_bottom):
+    """
+    Bubbles given by the top left corner and size of their bounding square against axis aligned rectangles,
+    balls are tested as circles and hexagons as polygons
+    :return: True where the bubble and the rectangle overlap
+    """
+    radius = extent / 2
+    circle = circle_rect_overlap(left + radius, top + radius, radius, rect_left, rect_top, rect_right, rect_bottom)
+    hexagon = hexagon_rect_overlap(left, top, extent, rect_left, rect_top, rect_right, rect_bottom)
+    return np.where(is_hexagon, hexagon, circle)
+
+
+def collide_bubble(bubble, is_ball, sprite):
+    """
+    Analytic replacement of pygame.sprite.collide_mask for a bubble and a sprite with a rectangular shape
+    """
+    rect = sprite.rect
+    return bool(bubble_rect_overlap(not is_ball, bubble.rect.left, bubble.rect.top, bubble.rect.width,
+                                    rect.left, rect.top, rect.right, rect.bottom))
+
+
+def collide_harpoon(bubble, is_ball, weapon):
+    """
+    Analytic replacement of pygame.sprite.collide_rect for a bubble and the weapon, the harpoon is tested
+    as its whole rect
+    """
+    return collide_bubble(bubble, is_ball, weapon)
+
+
+def compare_with_masks(game):
+    """
+    Check the analytic path against the pixel masks for every bubble against every player and its active weapon
+    :return: (number of contacts found by any of the paths, number of disagreements, mask contacts missed)
+    """
+    import pygame
+    contacts = disagreements = missed = 0
+    for player in game.players:
+        sprites = [(player, collide_bubble)]
+        if player.weapon.is_active:
+            sprites.append((player.weapon, collide_harpoon))
+        for sprite, collide in sprites:
+            for bubbles, is_ball in ((game.balls, True), (game.hexagons, False)):
+                for bubble in bubbles:
+                    mask = bool(pygame.sprite.collide_mask(bubble, sprite))
+                    analytic = collide(bubble, is_ball, sprite)
+                    contacts += mask or analytic
+                    disagreements += mask != analytic
+                    missed += mask and not analytic
+    return contacts, disagreements, missed
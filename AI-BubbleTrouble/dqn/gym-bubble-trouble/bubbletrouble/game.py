@@ -1,13 +1,24 @@
-from threading import Timer
-import json
+import numpy as np
 
 from bubbles import *
 from player import *
+from clock import LevelClock
+from physics import BubbleArrays
+from collision import collide_bubble, collide_harpoon, ANALYTIC, COLLISION_MODES
+from levels import get_level, get_max_level_available, X, Y, SIZE, SPEED_X, SPEED_Y
+from snapshot import GameSnapshot, pack_bubbles, unpack_bubbles, pack_players, unpack_players
+
+# Scalars of the game kept in GameSnapshot.state, followed by the frames and limit of the level clock
+SNAPSHOT_STATE = ('level', 'score', 'game_over', 'level_completed', 'is_running', 'is_completed', 'is_multiplayer',
+                  'is_restarted', 'dead_player', 'num_of_popped', 'num_of_frames', 'max_level_available')
 
 
 class BubbleTroubleGame:
 
-    def __init__(self, level=1):
+    def __init__(self, level=1, collision='mask'):
+        if collision not in COLLISION_MODES:
+            raise ValueError('collision must be one of {}'.format(COLLISION_MODES))
+        self.collision = collision
         self.balls = []
         self.hexagons = []
         self.players = [Player()]
@@ -24,24 +35,18 @@ class BubbleTroubleGame:
         self.dead_player = False
         self.mode = 'Classic'
         self.score = 0
-        self.timers = None
-
-        self.time_by_level = {i: 0 for i in range(1, 6)}
-        self.popped_by_level = {i: 0 for i in range(1, 6)}
-        self.lives_by_level = {i: 0 for i in range(1, 6)}
-
-        self.num_of_popped = 0
-        self.num_of_frames = 0
+        self.clock = LevelClock()
+        self.bubble_arrays = BubbleArrays()
+        self.physics_threshold = MAX_BALLS_AT_ALL_TIME
+        # True while the bubble arrays hold the speeds of the bubbles, see sync_bubbles
+        self.bubbles_in_arrays = False
 
-        with open(APP_PATH + 'max_level_available', 'r') as max_completed_level_file:
-            max_level_available = max_completed_level_file.read()
-            if max_level_available:
-                self.max_level_available = int(max_level_available)
-            else:
-                self.max_level_available = 1
+        self.reset_stats()
+        self.max_level_available = get_max_level_available()
 
     def load_level(self, level):
         self.is_restarted = True
+        self._release_bubble_arrays()
         if self.is_multiplayer and len(self.players) == 1:
             self.players.append(Player('player2.png'))
         self.balls = []
@@ -59,33 +64,59 @@ class BubbleTroubleGame:
             self.level = 1
             self.max_level_available = self.level
 
-        with open(APP_PATH + 'levels.json', 'r') as levels_file:
-            levels = json.load(levels_file)
-            level = levels[str(self.level)]
-            self.time_left = level['time']
-            for ball in level['balls']:
-                x, y = ball['x'], ball['y']
+        template = get_level(self.level)
+        self.clock.reset(template.time)
+        for ball in template.balls.tolist():
+            self.balls.append(Ball(ball[X], ball[Y], ball[SIZE], [ball[SPEED_X], ball[SPEED_Y]]))
+        for hexagon in template.hexagons.tolist():
+            self.hexagons.append(Hexagon(hexagon[X], hexagon[Y], hexagon[SIZE], [hexagon[SPEED_X], hexagon[SPEED_Y]]))
 
-                size = ball['size']
-                speed = ball['speed']
-                self.balls.append(Ball(x, y, size, speed))
-            for hexagon in level['hexagons']:
-                x, y = hexagon['x'], hexagon['y']
+    @property
+    def time_left(self):
+        return self.clock.time_left
 
-                size = hexagon['size']
-                speed = hexagon['speed']
-                self.hexagons.append(Hexagon(x, y, size, speed))
-        self._set_timers()
+    def snapshot(self):
+        """
+        Capture the state of the game without any Surface, the game has no randomness so there is no RNG state
+        :return: GameSnapshot - picklable and independent of this game
+        """
+        self.sync_bubbles()
+        state = np.array([getattr(self, name) for name in SNAPSHOT_STATE] + [self.clock.frames, self.clock.limit],
+                         dtype=np.int64)
+        return GameSnapshot(state, pack_bubbles(self.balls), pack_bubbles(self.hexagons), pack_players(self.players),
+                            None, None)
 
-    def exit_game(self):
-        self._stop_timers()
+    def restore(self, snapshot):
+        """
+        Bring the game to the state of the given snapshot, any number of games may be restored from the same snapshot
+        :param snapshot: GameSnapshot - returned by snapshot()
+        """
+        state = snapshot.state.tolist()
+        for name, value in zip(SNAPSHOT_STATE, state):
+            setattr(self, name, type(getattr(self, name))(value))
+        self.clock.frames, self.clock.limit = state[len(SNAPSHOT_STATE):]
+        self._release_bubble_arrays()
+        self.balls = unpack_bubbles(snapshot.balls, Ball)
+        self.hexagons = unpack_bubbles(snapshot.hexagons, Hexagon)
+        self.bonuses = []
+        if len(self.players) != len(snapshot.players):
+            self.players = [Player('player2.png') if index else Player() for index in range(len(snapshot.players))]
+            self.player = self.players[0]
+        unpack_players(snapshot.players, self.players)
+
+    def reset_stats(self):
+        """
+        Clear the statistics kept per level, they are not part of the snapshots
+        """
+        self.time_by_level = {i: 0 for i in range(1, 6)}
+        self.popped_by_level = {i: 0 for i in range(1, 6)}
+        self.lives_by_level = {i: 0 for i in range(1, 6)}
 
-    def _stop_timers(self):
-        if self.timers is not None:
-            for timer in self.timers:
-                if timer.is_alive():
-                    timer.cancel()
-        self.timers = None
+        self.num_of_popped = 0
+        self.num_of_frames = 0
+
+    def exit_game(self):
+        self.is_running = False
 
     def move_player(self, direction):
         self.player.moving_right = direction == -1
@@ -101,18 +132,9 @@ class BubbleTroubleGame:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.exit_game()
 
-    def _start_timer(self):
-        self._timer(1, self._tick_second, self.time_left)
-
-    def _set_timers(self):
-        self._stop_timers()
-        self.timers = [Timer(t, self._tick, []) for t in range(0, self.time_left)]
-        for timer in self.timers:
-            timer.start()
-
     def _tick(self):
-        self.time_left -= 1
-        if self.time_left == 0:
+        # Advance the level clock by one frame, the player loses a life when the time runs out
+        if self.clock.tick():
             self._decrease_lives(self.player)
 
     def _check_for_collisions(self):
@@ -122,7 +144,7 @@ class BubbleTroubleGame:
 
     def _check_for_bubble_collision(self, bubbles, is_ball, player):
         for bubble_index, bubble in enumerate(bubbles):
-            if self._check_weapon_ball_collision(bubble):
+            if self._check_weapon_ball_collision(bubble, is_ball):
                 player.weapon.is_active = False
                 self.score += 1
                 if is_ball:
@@ -131,16 +153,23 @@ class BubbleTroubleGame:
                     self._split_hexagon(bubble_index)
                 self.num_of_popped += 1
                 return True
-            if pygame.sprite.collide_mask(bubble, player):
+            if self._check_player_ball_collision(bubble, is_ball, player):
                 player.is_alive = False
                 self._decrease_lives(player)
                 return True
         return False
 
-    def _check_weapon_ball_collision(self, bubble):
+    def _check_weapon_ball_collision(self, bubble, is_ball=True):
         player = self.player
+        if self.collision == ANALYTIC:
+            return player.weapon.is_active and collide_harpoon(bubble, is_ball, player.weapon)
         return pygame.sprite.collide_rect(bubble, player.weapon) and player.weapon.is_active
 
+    def _check_player_ball_collision(self, bubble, is_ball, player):
+        if self.collision == ANALYTIC:
+            return collide_bubble(bubble, is_ball, player)
+        return pygame.sprite.collide_mask(bubble, player)
+
     def _decrease_lives(self, player):
         player.lives -= 1
         if player.lives:
@@ -153,6 +182,7 @@ class BubbleTroubleGame:
         self.load_level(self.level)
 
     def _split_ball(self, ball_index):
+        self._release_bubble_arrays()
         ball = self.balls[ball_index]
         if ball.size > 1:
             self.balls.append(Ball(ball.rect.left - ball.size ** 2, ball.rect.top - 10, ball.size - 1, [-3, -5]))
@@ -160,12 +190,41 @@ class BubbleTroubleGame:
         del self.balls[ball_index]
 
     def _split_hexagon(self, hex_index):
+        self._release_bubble_arrays()
         hexagon = self.hexagons[hex_index]
         if hexagon.size > 1:
             self.hexagons.append(Hexagon(hexagon.rect.left, hexagon.rect.centery, hexagon.size - 1, [-3, -5]))
             self.hexagons.append(Hexagon(hexagon.rect.right, hexagon.rect.centery, hexagon.size - 1, [3, -5]))
         del self.hexagons[hex_index]
 
+    def sync_bubbles(self):
+        """
+        Write the speeds of the bubbles moved by the bubble arrays into their sprites, their rects are always current
+        """
+        if self.bubbles_in_arrays:
+            self.bubble_arrays.store_speeds()
+
+    def _release_bubble_arrays(self):
+        # The sprites become the state of the bubbles again, before they are added, removed or replaced
+        self.sync_bubbles()
+        self.bubbles_in_arrays = False
+
+    def _update_bubbles(self):
+        # Many bubbles are moved in one vectorized pass instead of a Sprite update per bubble, the arrays
+        # are loaded only when the bubbles change
+        if len(self.balls) + len(self.hexagons) >= self.physics_threshold:
+            if not self.bubbles_in_arrays:
+                self.bubble_arrays.load(self.balls, self.hexagons)
+                self.bubbles_in_arrays = True
+            self.bubble_arrays.step()
+            self.bubble_arrays.store_rects()
+        else:
+            self._release_bubble_arrays()
+            for ball in self.balls:
+                ball.update()
+            for hexagon in self.hexagons:
+                hexagon.update()
+
     def update(self):
         self.num_of_frames += 1
         if self.level_completed and not self.is_completed:
@@ -186,11 +245,9 @@ class BubbleTroubleGame:
             print(self.players[0].lives)
             self.num_of_popped = 0
             self._restart()
+        self._tick()
         self._check_for_collisions()
-        for ball in self.balls:
-            ball.update()
-        for hexagon in self.hexagons:
-            hexagon.update()
+        self._update_bubbles()
         for player in self.players:
             player.update()
         for bonus in self.bonuses:
@@ -200,14 +257,3 @@ class BubbleTroubleGame:
             self.level_completed = True
             if self.level == self.max_level:
                 self.is_completed = True
-
-    def _timer(self, interval, worker_func, iterations=0):
-        if iterations and not self.dead_player and not self.level_completed and not self.is_restarted:
-            Timer(interval, self._timer, [interval, worker_func, 0 if iterations == 0 else iterations - 1]).start()
-            worker_func()
-
-    def _tick_second(self):
-        self.time_left -= 1
-        if self.time_left == 0:
-            for player in self.players:
-                self._decrease_lives(player)
@@ -29,7 +29,6 @@ def start_level(level):
             pygame.time.delay(1000)
         if game.is_restarted:
             game.is_restarted = False
-            game._start_timer()
         clock.tick(FPS)
 
 
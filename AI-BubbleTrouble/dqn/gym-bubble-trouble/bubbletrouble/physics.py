@@ -0,0 +1,104 @@
+import numpy as np
+
+from settings import *
+
+BALL = 0
+HEXAGON = 1
+
+
+def move_bubbles(left, top, speed_x, speed_y, extent, gravity):
+    """
+    Advance bubbles by a single frame, all the arrays are updated in place and may have any shape.
+    Matches Ball.update / Hexagon.update: gravity, move, bounce on the walls and clip into the window
+    :param left: int array - x of the top left corner of every bubble
+    :param top: int array - y of the top left corner of every bubble
+    :param speed_x: int array - horizontal speed of every bubble
+    :param speed_y: int array - vertical speed of every bubble
+    :param extent: int array - size in pixels of every bubble
+    :param gravity: int or int array - added to the vertical speed, GRAVITY for balls and 0 for hexagons
+    """
+    speed_y += gravity
+    left += speed_x
+    top += speed_y
+    np.negative(speed_x, out=speed_x, where=(left < 0) | (left + extent > WINDOWWIDTH))
+    np.negative(speed_y, out=speed_y, where=(top < 0) | (top + extent > WINDOWHEIGHT))
+    np.clip(left, 0, WINDOWWIDTH, out=left)
+    np.minimum(left + extent, WINDOWWIDTH, out=left)
+    left -= extent
+    np.clip(top, 0, WINDOWHEIGHT, out=top)
+    np.minimum(top + extent, WINDOWHEIGHT, out=top)
+    top -= extent
+
+
+class BubbleArrays:
+    """
+    Struct of arrays with the state of the bubbles of a single game, used to update all of them
+    in one vectorized pass instead of a Sprite update per bubble.
+    The arrays are loaded once from the sprites and stay the state of the bubbles until the sprites change,
+    every step only the rects are written back and the speeds are written when they are read
+    """
+
+    def __init__(self, capacity=MAX_BALLS_AT_ALL_TIME):
+        self.count = 0
+        self.bubbles = []
+        self.left = np.zeros(capacity, dtype=np.int64)
+        self.top = np.zeros(capacity, dtype=np.int64)
+        self.speed_x = np.zeros(capacity, dtype=np.int64)
+        self.speed_y = np.zeros(capacity, dtype=np.int64)
+        self.extent = np.zeros(capacity, dtype=np.int64)
+        self.size = np.zeros(capacity, dtype=np.int64)
+        self.kind = np.zeros(capacity, dtype=np.int8)
+
+    def _reserve(self, count):
+        if count <= len(self.left):
+            return
+        capacity = max(count, 2 * len(self.left))
+        for name in ('left', 'top', 'speed_x', 'speed_y', 'extent', 'size', 'kind'):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def load(self, balls, hexagons):
+        """
+        Copy the state of the given Ball and Hexagon sprites into the arrays
+        """
+        self.bubbles = balls + hexagons
+        count = self.count = len(self.bubbles)
+        self._reserve(count)
+        rects = [bubble.rect for bubble in self.bubbles]
+        self.left[:count] = [rect.left for rect in rects]
+        self.top[:count] = [rect.top for rect in rects]
+        self.extent[:count] = [rect.width for rect in rects]
+        self.speed_x[:count] = [bubble.speed[0] for bubble in self.bubbles]
+        self.speed_y[:count] = [bubble.speed[1] for bubble in self.bubbles]
+        self.size[:count] = [bubble.size for bubble in self.bubbles]
+        self.kind[:len(balls)] = BALL
+        self.kind[len(balls):count] = HEXAGON
+
+    def store_rects(self):
+        """
+        Write the positions in the arrays into the rects of the sprites they were loaded from
+        """
+        count = self.count
+        for bubble, left, top in zip(self.bubbles, self.left[:count].tolist(), self.top[:count].tolist()):
+            bubble.rect.topleft = left, top
+
+    def store_speeds(self):
+        """
+        Write the speeds in the arrays into the sprites they were loaded from
+        """
+        count = self.count
+        for bubble, speed_x, speed_y in zip(self.bubbles, self.speed_x[:count].tolist(),
+                                            self.speed_y[:count].tolist()):
+            bubble.speed[0], bubble.speed[1] = speed_x, speed_y
+
+    def step(self):
+        """
+        Advance all the bubbles by a single frame
+        """
+        count = self.count
+        kind = self.kind[:count]
+        gravity = np.where(kind == BALL, GRAVITY, 0)
+        move_bubbles(self.left[:count], self.top[:count], self.speed_x[:count], self.speed_y[:count],
+                     self.extent[:count], gravity)
@@ -2,12 +2,14 @@ import pygame
 
 from weapon import Weapon
 from settings import *
+from assets import get_image, get_mask
 
 
 class Player(pygame.sprite.Sprite):
     def __init__(self, image_name='player.png'):
         super(Player, self).__init__()
-        self.image = pygame.image.load(IMAGES_PATH + image_name)
+        self.image = get_image(image_name)
+        self.mask = get_mask(image_name)
         self.rect = self.image.get_rect()
         self.weapon = Weapon()
         self.moving_left = False
@@ -19,6 +19,7 @@ IMAGES_PATH = APP_PATH + 'images/'
 MAX_BALL_SIZE = 5
 SIZE_TO_PIXELS = 15
 PLAYER_SHAPE = (37, 23)
+WEAPON_SHAPE = (480, 8)
 MAX_BALLS_AT_ALL_TIME = 2 * 2 ** (MAX_BALL_SIZE - 1)
 PLAYER_HEIGHT = 37 / WINDOWHEIGHT
 PLAYER_WIDTH = 23 / WINDOWWIDTH
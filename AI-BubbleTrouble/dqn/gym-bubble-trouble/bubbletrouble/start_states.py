@@ -0,0 +1,76 @@
+import random
+
+import numpy as np
+
+from settings import *
+from game import BubbleTroubleGame
+from snapshot import LEFT, SIZE
+
+# Largest horizontal shift in pixels of the bubbles of a jittered start state
+JITTER = 40
+
+
+class StartStatePool:
+    """
+    Snapshots of the start of every level, so a game can be brought to any level without playing
+    the ones before it. Every level has its exact start state followed by jittered variants, in which
+    every bubble is shifted horizontally inside the window
+    """
+
+    def __init__(self, variants=0, jitter=JITTER, seed=None):
+        """
+        :param variants: int - number of jittered variants of every level
+        :param jitter: int - largest shift in pixels of a bubble in a variant
+        :param seed: seed of the random shifts and of sample
+        """
+        self.variants = variants
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.starts = {}
+        game = BubbleTroubleGame()
+        max_level_available = game.max_level_available
+        for level in range(1, MAX_LEVEL + 1):
+            # load_level falls back to the first level past the max level available
+            game.max_level_available = max(level, max_level_available)
+            game.load_level(level)
+            self.starts[level] = game.snapshot()
+        self.states = {}
+        self._make_variants()
+
+    def _make_variants(self):
+        for level, start in self.starts.items():
+            self.states[level] = [start] + [self._jitter(start, self.jitter) for _ in range(self.variants)]
+            for state in self.states[level]:
+                for array in state:
+                    if array is not None:
+                        array.setflags(write=False)
+
+    def seed(self, seed=None):
+        """
+        Seed the random shifts and sample, the jittered variants are drawn again from the seed
+        """
+        self.rng.seed(seed)
+        self._make_variants()
+
+    def _jitter(self, snapshot, jitter):
+        balls, hexagons = snapshot.balls.copy(), snapshot.hexagons.copy()
+        for bubbles in (balls, hexagons):
+            shift = [self.rng.randint(-jitter, jitter) for _ in range(len(bubbles))]
+            max_left = WINDOWWIDTH - bubbles[:, SIZE] * SIZE_TO_PIXELS
+            bubbles[:, LEFT] = np.clip(bubbles[:, LEFT] + shift, 0, max_left)
+        return snapshot._replace(balls=balls, hexagons=hexagons)
+
+    def get(self, level, variant=0):
+        """
+        :param level: int - level in [1, MAX_LEVEL]
+        :param variant: int - 0 for the exact start of the level, 1 and on for its jittered variants
+        :return: GameSnapshot - to be restored into a game, it must not be changed
+        """
+        return self.states[level][variant]
+
+    def sample(self, level):
+        """
+        :param level: int - level in [1, MAX_LEVEL]
+        :return: GameSnapshot - a random one of the start states of the level
+        """
+        return self.rng.choice(self.states[level])
@@ -1,12 +1,14 @@
 import pygame
 from settings import *
+from assets import get_image, get_mask
 
 
 class Weapon(pygame.sprite.Sprite):
     def __init__(self, x=0, y=0):
         self.is_active = False
         pygame.sprite.Sprite.__init__(self)
-        self.image = pygame.image.load(IMAGES_PATH + 'arrow.png')
+        self.image = get_image('arrow.png')
+        self.mask = get_mask('arrow.png')
         self.rect = self.image.get_rect(centerx=x, top=y)
 
     def update(self):
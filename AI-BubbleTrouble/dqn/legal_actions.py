@@ -0,0 +1,95 @@
+import numpy as np
+
+from settings import *
+from env import ACTION_LEFT, ACTION_RIGHT, ACTION_FIRE, ACTION_IDLE
+from spatial import AXIS_X
+
+TOO_LOW = 80
+TOO_CLOSE = 50
+TOO_FAR = 320
+TOO_FAR_X = 150
+
+
+def get_legal_actions(env):
+    """
+    :param env: BubbleTroubleEnv or a wrapper of it
+    :return:  Returns set of legal action minus 'irrational' if exist
+    """
+    player = env.game.player
+    query = env.bubble_query
+    actions = []
+    logic_actions = get_logic_actions(env)
+    if logic_actions:
+        return logic_actions
+    if player.rect.left > 0:
+        actions.append(ACTION_LEFT)
+    if player.rect.right < WINDOWWIDTH:
+        actions.append(ACTION_RIGHT)
+    if player.can_shoot() and query.closest(AXIS_X)[1] < TOO_FAR_X:
+        actions.append(ACTION_FIRE)
+    actions.append(ACTION_IDLE)
+    return actions
+
+
+def get_legal_mask(env, out=None):
+    """
+    :param env: BubbleTroubleEnv or a wrapper of it
+    :param out: bool array of shape (num_actions,) to write into, a new array if not given
+    :return: bool array - True for the actions returned by get_legal_actions
+    """
+    if out is None:
+        out = np.zeros(env.action_space.n, dtype=bool)
+    else:
+        out.fill(False)
+    out[get_legal_actions(env)] = True
+    return out
+
+
+def get_logic_actions(env):
+    """
+    :param env: BubbleTroubleEnv or a wrapper of it
+    :return: Returns 'logical' set of action that the player may execute
+    """
+    query = env.bubble_query
+    closest_ball, closest_dist = query.closest()
+    if not closest_ball:
+        return []
+
+    player = env.game.player
+    ball_rec = closest_ball.rect
+    on_the_left = ball_rec.centerx <= player.rect.centerx
+
+    if _is_in_danger(player, ball_rec, closest_dist):
+
+        if on_the_left:
+            return [ACTION_RIGHT, ACTION_FIRE] if player.can_shoot() else [ACTION_RIGHT]
+        else:
+            return [ACTION_LEFT, ACTION_FIRE] if player.can_shoot() else [ACTION_LEFT]
+
+    if _is_too_far(query) and _is_normal_ball(env, closest_ball):
+
+        if on_the_left:
+            return [ACTION_LEFT]
+        else:
+            return [ACTION_RIGHT]
+
+
+def _is_in_danger(player, ball_rec, closest_dist):
+    # True if the player in danger zone and false otherwise
+    too_low = WINDOWHEIGHT - ball_rec.centery <= TOO_LOW
+    return _is_too_close(closest_dist) and (not player.can_shoot() or player.can_shoot() and too_low)
+
+
+def _is_normal_ball(env, ball):
+    # Normal means not Hexagon
+    return ball in env.game.balls
+
+
+def _is_too_close(closest_dist):
+    # True if too close to the closest ball and false otherwise
+    return closest_dist < TOO_CLOSE
+
+
+def _is_too_far(query):
+    # True if too far from the closest ball and false otherwise
+    return query.closest(AXIS_X)[1] > TOO_FAR
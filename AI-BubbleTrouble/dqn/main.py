@@ -2,7 +2,10 @@ import torch
 from manager import EnvManager
 from strategy import EpsilonGreedyStrategy
 from agent import Agent
-from models import CNN
+from models import CNN, MLP
+from env import OBS_PIXELS, OBS_FEATURES, OBS_PLANES
+from planes import NUM_PLANES
+from features import FEATURE_SIZE
 import torch.optim as optim
 import project_utils as utils
 from parameters import *
@@ -13,21 +16,30 @@ os.environ['KMP_DUPLICATE_LIB_OK'] = 'True'
 PATH_TO_MODEL = r'{}\trained_models\test2.7'
 
 
-def run_dqn_agent(to_train=False):
+def run_dqn_agent(to_train=False, obs_type=OBS_PIXELS):
     """
     Loading and testing an agent for the Bubble Trouble game
-
+    :param obs_type: observation of the env, OBS_FEATURES is learned by the MLP and the others by the CNN,
+    with OBS_PLANES every stacked frame has NUM_PLANES channels
     """
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    em = EnvManager(device, NUM_OF_CHANNELS, SKIP_FRAMES, to_skip=False, ep_live=True)
+    em = EnvManager(device, NUM_OF_CHANNELS, SKIP_FRAMES, to_skip=False, ep_live=True, headless=to_train,
+                    obs_type=obs_type)
     num_actions = em.num_actions_available()
-    test_em = EnvManager(device, NUM_OF_CHANNELS, SKIP_FRAMES, to_skip=False, ep_live=False)
-    policy_net, target_net = utils.init_networks(NUM_OF_CHANNELS, num_actions, CNN, device)
+    test_em = EnvManager(device, NUM_OF_CHANNELS, SKIP_FRAMES, to_skip=False, ep_live=False, obs_type=obs_type)
+    if obs_type == OBS_FEATURES:
+        policy_net, target_net = utils.init_networks(FEATURE_SIZE, num_actions, MLP, device)
+    elif obs_type == OBS_PLANES:
+        policy_net, target_net = utils.init_networks(NUM_OF_CHANNELS * NUM_PLANES, num_actions, CNN, device)
+    else:
+        policy_net, target_net = utils.init_networks(NUM_OF_CHANNELS, num_actions, CNN, device)
     optimizer = optim.Adam(params=policy_net.parameters(), lr=LR)
     strategy = EpsilonGreedyStrategy(EPS_START, EPS_END, EPS_DECAY)
 
     if to_train:
         agent = Agent(policy_net, target_net, strategy, em, test_em, em.num_actions_available(), optimizer)
+        if agent.checkpoint is not None and agent.checkpoint.exists():
+            agent.load_replay()
         agent.train(NUM_EPISODES)
     else:
         utils.load_model(policy_net, target_net, optimizer, PATH_TO_MODEL.format(os.path.dirname(__file__)))
@@ -1,12 +1,14 @@
+from functools import partial
+
+import torch
+
 from wrappers import *
-from env import BubbleTroubleEnv
+from async_env import AsyncBubbleTroubleEnv
+from vector_env import VectorBubbleTroubleEnv
+from env import BubbleTroubleEnv, OBS_PIXELS, OBS_FEATURES, OBS_PLANES
 from settings import *
-from project_utils import get_state
-
-TOO_LOW = 80
-TOO_CLOSE = 50
-TOO_FAR = 320
-TOO_FAR_X = 150
+from project_utils import get_state, get_features_state
+from legal_actions import get_legal_actions, get_legal_mask, get_logic_actions
 
 ACTION_LEFT = 0
 ACTION_RIGHT = 1
@@ -16,44 +18,84 @@ ACTION_IDLE = 3
 reward_dict = {'moving': .0, 'fire': .0, 'score': 1, 'death': -1., 'win': 0, 'step': .0}
 
 
+def make_env(num_frames=4, skip=2, to_skip=True, ep_live=False, headless=False, obs_type=OBS_PIXELS,
+             start_variants=0):
+    """
+    :param start_variants: number of jittered start states of every level, see BubbleTroubleEnv
+    :return: BubbleTroubleEnv in the wrappers of EnvManager
+    """
+    # The wrappers, the async workers and EnvManager all copy the observations out of the env's buffer
+    env = BubbleTroubleEnv(rewards=reward_dict, headless=headless, obs_type=obs_type, copy_obs=False,
+                           start_variants=start_variants)
+    # The features hold the speeds of the bubbles, so they are neither stacked nor max pooled
+    if to_skip:
+        env = SkipEnv(env, skip) if obs_type == OBS_FEATURES else MaxAndSkipEnv(env, skip)
+    if ep_live:
+        env = EpisodicLifeEnv(env)
+    if obs_type != OBS_FEATURES:
+        env = FrameStack(env, num_frames)
+    return env
+
+
 class EnvManager:
     """
-    This class is responsible for managing the Bubble trouble environment
+    This class is responsible for managing the Bubble trouble environment.
+    With num_envs > 1 it manages that many headless envs in subprocesses, or in a single
+    VectorBubbleTroubleEnv for the features, the states, rewards and dones are then batched and step takes
+    an action per env
     """
 
-    def __init__(self, device, num_frames=4, skip=2, to_skip=True, ep_live=False):
+    def __init__(self, device, num_frames=4, skip=2, to_skip=True, ep_live=False, headless=False, obs_type=OBS_PIXELS,
+                 num_envs=1, seed=None, start_variants=0):
         self.device = device
-        self.env = BubbleTroubleEnv(rewards=reward_dict)
-        self.env = FrameStack(self.env, num_frames)
-        if to_skip:
-            self.env = MaxAndSkipEnv(self.env, skip)
-        if ep_live:
-            self.env = EpisodicLifeEnv(self.env)
+        self.num_envs = num_envs
+        # Number of observations stacked in a state
+        self.stack_size = 1 if obs_type == OBS_FEATURES else num_frames
+        # The planes are binary, so the replay memory keeps them bit-packed
+        self.packed_frames = obs_type == OBS_PLANES
+        self.get_state = get_features_state if obs_type == OBS_FEATURES else get_state
+        if num_envs > 1 and obs_type == OBS_FEATURES:
+            self.env = VectorBubbleTroubleEnv(num_envs, rewards=reward_dict, skip=skip if to_skip else 1,
+                                              ep_live=ep_live, start_variants=start_variants, seed=seed)
+        elif num_envs > 1:
+            env_fn = partial(make_env, num_frames, skip, to_skip, ep_live, True, obs_type, start_variants)
+            self.env = AsyncBubbleTroubleEnv(env_fn, num_envs, seed=seed)
+        else:
+            self.env = make_env(num_frames, skip, to_skip, ep_live, headless, obs_type, start_variants)
+            if seed is not None:
+                self.env.unwrapped.seed(seed)
         self.done = False
         self.env.reset()
         self.curr_screen = None
         self.frame_counter = 0
 
-    def reset(self):
+    def reset(self, level=1):
         """
         Reset the environment and returns the first observation
+        :param level: int - level to start from
         """
-        ob = self.env.reset()
-        ob = get_state(ob)
+        ob = self.env.reset(level=level)
+        ob = self._to_state(ob)
         return ob
 
     def step(self, action):
         """
         Execute a single step of the game
 
-        :param action: int - action to execute
+        :param action: int - action to execute, an array of actions with num_envs > 1
         :return: observation - Tensor, reward -int, done -boolean, info -Not in use
         """
         ob, reward, done, info = self.env.step(action)
-        ob = get_state(ob)
+        ob = self._to_state(ob)
         self.done = done
         return ob, reward, done, info
 
+    def _to_state(self, ob):
+        # The observations of the wrappers are views of their buffers, the states are kept by the agent
+        if self.num_envs > 1:
+            return torch.cat([self.get_state(env_ob) for env_ob in ob])
+        return self.get_state(ob).clone()
+
     def close(self):
         self.env.close()
 
@@ -83,64 +125,27 @@ class EnvManager:
 
     def get_legal_actions(self):
         """
-        :return:  Returns set of legal action minus 'irrational' if exist
-        """
-        player = self._get_player()
-        actions = []
-        logic_actions = self.get_logic_actions()
-        if logic_actions:
-            return logic_actions
-        if player.rect.left > 0:
-            actions.append(ACTION_LEFT)
-        if player.rect.right < WINDOWWIDTH:
-            actions.append(ACTION_RIGHT)
-        if player.can_shoot() and self.env.closest_dist < TOO_FAR_X:
-            actions.append(ACTION_FIRE)
-        actions.append(ACTION_IDLE)
-        return actions
+        :return:  Returns set of legal action minus 'irrational' if exist, a list per env with num_envs > 1
+        """
+        if self.num_envs > 1:
+            return self.env.get_legal_actions()
+        return get_legal_actions(self.env)
+
+    def get_legal_mask(self):
+        """
+        :return: bool Tensor of shape (num_envs, num_actions) on the device - True for the legal actions of every env
+        """
+        if self.num_envs > 1:
+            mask = self.env.get_legal_masks().copy()
+        else:
+            mask = get_legal_mask(self.env)[None]
+        return torch.from_numpy(mask).to(self.device)
 
     def get_logic_actions(self):
         """
         :return: Returns 'logical' set of action that the player may execute
         """
-        if not self.env.closest_ball_euc:
-            return []
-
-        player = self._get_player()
-        ball_rec = self.env.closest_ball_euc.rect
-        on_the_left = ball_rec.centerx <= player.rect.centerx
-
-        if self._is_in_danger(ball_rec):
-
-            if on_the_left:
-                return [ACTION_RIGHT, ACTION_FIRE] if player.can_shoot() else [ACTION_RIGHT]
-            else:
-                return [ACTION_LEFT, ACTION_FIRE] if player.can_shoot() else [ACTION_LEFT]
-
-        if self._is_too_far() and self._is_normal_ball():
-
-            if on_the_left:
-                return [ACTION_LEFT]
-            else:
-                return [ACTION_RIGHT]
-
-    def _is_in_danger(self, ball_rec):
-        # True if the player in danger zone and false otherwise
-        too_low = WINDOWHEIGHT - ball_rec.centery <= TOO_LOW
-        player = self._get_player()
-        return self._is_too_close() and (not player.can_shoot() or player.can_shoot() and too_low)
-
-    def _is_normal_ball(self):
-        # Normal means not Hexagon
-        return self.env.closest_ball_euc in self.env.game.balls
-
-    def _is_too_close(self):
-        # True if too close to the closest ball and false otherwise
-        return self.env.closest_dist_euc < TOO_CLOSE
-
-    def _is_too_far(self):
-        # True if too far from the closest ball and false otherwise
-        return self.env.closest_dist > TOO_FAR
+        return get_logic_actions(self.env)
 
     def _get_game(self):
         return self.env.game
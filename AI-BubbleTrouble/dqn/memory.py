@@ -1,65 +1,500 @@
+import json
+import operator
+import os
 import random
-from collections import deque
 import numpy as np
+import torch
+
+from project_utils import Experience
+
+
+class SegmentTree:
+    """
+    Binary tree over a fixed number of leaves in which every node holds the reduction of its children,
+    stored in a flat array with the root at 1 and the children of node i at 2i and 2i + 1.
+    Updating a batch of leaves recomputes only their ancestors, one vectorized pass per level
+    """
+
+    def __init__(self, capacity, operation, scalar_operation, neutral):
+        """
+        :param capacity: int - number of leaves
+        :param operation: numpy ufunc of two arrays, np.add, np.minimum or np.maximum
+        :param scalar_operation: the same operation on two numbers, for updating a single leaf
+        :param neutral: value of the empty leaves, neutral to operation
+        """
+        self.capacity = capacity
+        self.depth = max(int(np.ceil(np.log2(capacity))), 0)
+        self.leaves = 1 << self.depth
+        self.operation = operation
+        self.scalar_operation = scalar_operation
+        self.neutral = neutral
+        self.tree = np.full(2 * self.leaves, neutral, dtype=np.float64)
+
+    def __getitem__(self, indices):
+        return self.tree[self.leaves + np.asarray(indices)]
+
+    def root(self):
+        """
+        :return: reduction of all the leaves
+        """
+        return self.tree[1]
+
+    def update(self, indices, values):
+        """
+        :param indices: int array - indices of the leaves, the last value of a repeated index is kept
+        :param values: array of the new values of the leaves
+        """
+        nodes = self.leaves + np.asarray(indices)
+        self.tree[nodes] = values
+        for _ in range(self.depth):
+            # A repeated node is recomputed from the same children, so the nodes need not be unique
+            nodes >>= 1
+            self.tree[nodes] = self.operation(self.tree[2 * nodes], self.tree[2 * nodes + 1])
+
+    def update_one(self, index, value):
+        """
+        Update a single leaf, cheaper than update for one leaf as the ancestors are computed on scalars
+        :param index: int - index of the leaf
+        :param value: new value of the leaf
+        """
+        tree = self.tree
+        node = self.leaves + index
+        tree[node] = value
+        while node > 1:
+            node >>= 1
+            tree[node] = self.scalar_operation(tree[2 * node], tree[2 * node + 1])
+
+    def build(self, values):
+        """
+        Replace the first len(values) leaves and rebuild the tree, the others are emptied
+        :param values: array of the values of the leaves
+        """
+        self.tree.fill(self.neutral)
+        self.tree[self.leaves:self.leaves + len(values)] = values
+        level = self.leaves
+        while level > 1:
+            self.tree[level // 2:level] = self.operation(self.tree[level:2 * level:2], self.tree[level + 1:2 * level:2])
+            level //= 2
+
+
+class SumTree(SegmentTree):
+
+    def __init__(self, capacity):
+        super(SumTree, self).__init__(capacity, np.add, operator.add, 0.)
+
+    def find_prefix_sum(self, values):
+        """
+        :param values: float array of values in [0, root())
+        :return: int array - for every value the leaf at which the running sum of the leaves passes it
+        """
+        nodes = np.ones(len(values), dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            # Rounding must never lead into an empty subtree
+            go_right = (values >= left_sum) & (self.tree[left + 1] > 0)
+            values -= left_sum * go_right
+            nodes = left + go_right
+        return nodes - self.leaves
+
+
+class MinTree(SegmentTree):
+
+    def __init__(self, capacity):
+        super(MinTree, self).__init__(capacity, np.minimum, min, np.inf)
+
+
+class MaxTree(SegmentTree):
+
+    def __init__(self, capacity):
+        super(MaxTree, self).__init__(capacity, np.maximum, max, -np.inf)
+
+
+class ListStorage:
+    """
+    Experiences kept as they are pushed in a ring list, sampled as a list of Experience
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.experiences = []
+        self.position = 0
+
+    def __len__(self):
+        return len(self.experiences)
+
+    def add(self, experience, stream=0):
+        """
+        :param experience: Experience
+        :param stream: int - index of the env the experience was played in, the experiences hold their
+        states so it is not used
+        :return: int - index of the experience, the oldest one is replaced when the storage is full
+        """
+        index = self.position
+        if len(self.experiences) < self.capacity:
+            self.experiences.append(experience)
+        else:
+            self.experiences[index] = experience
+        self.position = (self.position + 1) % self.capacity
+        return index
+
+    def get(self, indices):
+        """
+        :param indices: int array - indices of experiences
+        :return: list of the experiences
+        """
+        return [self.experiences[i] for i in indices]
+
+
+# Frames kept by every stream besides those of its transitions, see FrameStorage
+FRAME_SLACK = 256
+
+# Columns of FrameStorage.streams
+EPISODE_START = 0
+FRAME_COUNT = 1
+IS_OPEN = 2
+
+
+class FrameStorage:
+    """
+    Transitions of stacked frame states in which every frame is stored once.
+    The states of consecutive transitions of an episode share all but one frame, and the next state of
+    a transition is the state of the one after it, so only the newest frame of every state is kept, in a
+    preallocated ring of frames. The actions, rewards and dones are kept in arrays.
+    The states are rebuilt when they are sampled from the numbers of their frames: the frames before the
+    start of an episode are its first frame, as FrameStack repeats the first observation on reset.
+    The next states of the transitions that end an episode are all zero, as QValues.get_next treats them
+    as final states, the target of such a transition does not depend on its next state.
+    A state that is not the next state of the previous transition starts a new episode even if that
+    transition is not done, such as the first state after a resume, at the cost of one more frame.
+    The transitions of several envs stepped together are pushed to their own streams, in turn. The frames
+    of stream i are numbered i, i + num_streams, i + 2 * num_streams and so on, so every stream is
+    a ring of its own inside the ring of frames.
+    Binary frames such as the planes of OBS_PLANES may be kept bit-packed, 8 cells per byte
+    """
+
+    def __init__(self, capacity, stack_size, packed=False, num_streams=1):
+        """
+        :param capacity: int - number of transitions
+        :param stack_size: int - number of frames stacked in a state, 1 for states that are not stacked
+        :param packed: True to keep the frames bit-packed, the frames must be binary uint8 arrays
+        :param num_streams: int - number of envs whose transitions are pushed in turn
+        """
+        self.capacity = capacity
+        self.stack_size = stack_size
+        self.packed = packed
+        self.num_streams = num_streams
+        # Shape and type of the frames of the states, known on the first transition
+        self.frame_shape = None
+        self.frame_dtype = None
+        # Every stream has room for the frames of its oldest state, the next frame of its newest transition
+        # and the frames of up to FRAME_SLACK episodes that start without the previous transition being done
+        self.num_frames = num_streams * (-(-capacity // num_streams) + stack_size + 1 + FRAME_SLACK)
+        self.frames = None
+        self.actions = self._array('actions', capacity, np.int64)
+        self.rewards = self._array('rewards', capacity, np.float32)
+        self.dones = self._array('dones', capacity, bool)
+        # Number of the newest frame of the state of every transition, whose next frame is the next one of
+        # its stream, and of the first frame of its episode
+        self.numbers = self._array('numbers', capacity, np.int64)
+        self.starts = self._array('starts', capacity, np.int64)
+        # Number of transitions pushed
+        self.counters = self._array('counters', 1, np.int64)
+        # Of every stream the number of the first frame of its current episode, the number of frames it
+        # wrote and 1 if its last transition is not done, so the next state may continue it
+        self.streams = self._array('streams', (num_streams, 3), np.int64)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def count(self):
+        return int(self.counters[0])
+
+    def _array(self, name, shape, dtype):
+        # Zeroed array of the storage
+        return np.zeros(shape, dtype=dtype)
+
+    def _allocate_frames(self, shape, dtype):
+        # The frames of the given shape and type are kept as they are, or in a row of bytes when packed
+        self.frame_shape, self.frame_dtype = tuple(shape), np.dtype(dtype)
+        if self.packed:
+            self.frames = self._array('frames', (self.num_frames, -(-int(np.prod(shape)) // 8)), np.uint8)
+        else:
+            self.frames = self._array('frames', (self.num_frames,) + self.frame_shape, dtype)
+
+    def _write_frame(self, number, frame):
+        self.frames[number % self.num_frames] = frame
+
+    def _gather_frames(self, numbers):
+        # Frames of an int array of frame numbers, of shape numbers.shape + the shape of a frame
+        return self.frames[numbers % self.num_frames]
+
+    def _newest_frame(self, state):
+        # The frames of a state of shape (1, stack_size * channels, ...) are stacked along its channels
+        state = state.cpu().numpy()[0]
+        return state.reshape((self.stack_size, -1) + state.shape[1:])[-1]
+
+    def _encode_frame(self, frame):
+        return np.packbits(frame, axis=None) if self.packed else frame
+
+    def add(self, experience, stream=0):
+        """
+        :param experience: Experience of states returned by EnvManager, pushed in the order they were played
+        :param stream: int - index of the env the experience was played in
+        :return: int - index of the transition, the oldest one is replaced when the storage is full
+        """
+        frame = self._newest_frame(experience.state)
+        if self.frames is None:
+            # The frames are allocated on the first transition, when their shape and type are known
+            self._allocate_frames(frame.shape, frame.dtype)
+        frame = self._encode_frame(frame)
+        count, step = self.count, self.num_streams
+        episode_start, frame_count, is_open = self.streams[stream].tolist()
+        number = frame_count * step + stream
+        # The state continues the episode if its frame is the next frame of the previous transition of the stream
+        if is_open and np.array_equal(self._gather_frames(np.array([number - step]))[0], frame):
+            number -= step
+        else:
+            self._write_frame(number, frame)
+            episode_start = number
+        index = count % self.capacity
+        self.actions[index] = experience.action
+        self.rewards[index] = float(experience.reward)
+        self.dones[index] = experience.done
+        self.numbers[index] = number
+        self.starts[index] = episode_start
+        if not experience.done:
+            self._write_frame(number + step, self._encode_frame(self._newest_frame(experience.next_state)))
+        self.streams[stream] = episode_start, number // step + 1 + (not experience.done), not experience.done
+        self.counters[0] = count + 1
+        return index
+
+    def _stack(self, numbers, starts):
+        # Stacks ending at the given frame numbers, the frames before the start of their episode are its first
+        offsets = np.arange(1 - self.stack_size, 1) * self.num_streams
+        frame_numbers = np.maximum(numbers[:, None] + offsets, starts[:, None])
+        frames = self._gather_frames(frame_numbers)
+        if self.packed:
+            size = int(np.prod(self.frame_shape))
+            frames = np.unpackbits(frames, axis=-1, count=size).reshape(frame_numbers.shape + self.frame_shape)
+        return frames.reshape((len(numbers), -1) + self.frame_shape[1:])
+
+    def get(self, indices):
+        """
+        :param indices: int array - indices of transitions
+        :return: Experience of batches - states and next states of shape (batch, channels, ...) and of the type
+        of the pushed states, int64 actions, float32 rewards and bool dones of shape (batch,)
+        """
+        numbers, starts, dones = self.numbers[indices], self.starts[indices], self.dones[indices]
+        states = self._stack(numbers, starts)
+        next_states = self._stack(numbers + self.num_streams, starts)
+        next_states[dones] = 0
+        return Experience(torch.from_numpy(states), torch.from_numpy(self.actions[indices]),
+                          torch.from_numpy(next_states), torch.from_numpy(self.rewards[indices]),
+                          torch.from_numpy(dones))
+
+
+class MemmapFrameStorage(FrameStorage):
+    """
+    FrameStorage whose arrays and the priorities of its buffer are numpy.memmap files in a directory, for
+    capacities beyond RAM. The newest frames are also kept in a RAM cache, the sampled frames that are not
+    in it are read from the files once each and in file order.
+    The files stay consistent when the process stops between pushes, a storage created on the directory
+    of a previous run resumes it with all its transitions
+    """
+
+    META_FILE = 'meta.json'
+
+    def __init__(self, directory, capacity, stack_size, cache_size=2 ** 14, packed=False, num_streams=1):
+        """
+        :param directory: directory of the files, created if it does not exist
+        :param capacity: int - number of transitions
+        :param stack_size: int - number of frames stacked in a state, 1 for states that are not stacked
+        :param cache_size: int - number of the newest frames kept in RAM
+        :param packed: True to keep the frames bit-packed, the frames must be binary uint8 arrays
+        :param num_streams: int - number of envs whose transitions are pushed in turn
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.meta = {'capacity': capacity, 'stack_size': stack_size, 'packed': packed, 'num_streams': num_streams}
+        meta_path = os.path.join(directory, self.META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            layout = [meta[name] for name in ('capacity', 'stack_size', 'packed', 'num_streams')]
+            if layout != [capacity, stack_size, packed, num_streams]:
+                raise ValueError('{} holds a storage of capacity {}, stack size {}, packed {} and {} streams'.format(
+                    directory, *layout))
+            self.meta = meta
+        self.cache_size = cache_size
+        self.cache = None
+        # Number of the frame in every slot of the cache, -1 for an empty slot
+        self.cache_numbers = np.full(cache_size, -1, dtype=np.int64)
+        super(MemmapFrameStorage, self).__init__(capacity, stack_size, packed, num_streams)
+        self.priorities = self._array('priorities', capacity, np.float32)
+        if 'frame_shape' in self.meta:
+            self._allocate_frames(tuple(self.meta['frame_shape']), np.dtype(self.meta['frame_dtype']))
+
+    def _array(self, name, shape, dtype):
+        # Opens the file of the array if it exists, a new file is zeroed
+        path = os.path.join(self.directory, name + '.dat')
+        mode = 'r+' if os.path.exists(path) else 'w+'
+        return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+    def _write_meta(self):
+        with open(os.path.join(self.directory, self.META_FILE), 'w') as meta_file:
+            json.dump(self.meta, meta_file)
+
+    def _allocate_frames(self, shape, dtype):
+        super(MemmapFrameStorage, self)._allocate_frames(shape, dtype)
+        self.cache = np.zeros((self.cache_size,) + self.frames.shape[1:], dtype=self.frames.dtype)
+        if 'frame_shape' not in self.meta:
+            self.meta.update(frame_shape=list(shape), frame_dtype=np.dtype(dtype).str)
+            self._write_meta()
+
+    def _write_frame(self, number, frame):
+        super(MemmapFrameStorage, self)._write_frame(number, frame)
+        slot = number % self.cache_size
+        self.cache[slot] = frame
+        self.cache_numbers[slot] = number
+
+    def _gather_frames(self, numbers):
+        slots = numbers % self.cache_size
+        cached = self.cache_numbers[slots] == numbers
+        frames = self.cache[slots]
+        if not cached.all():
+            # Every missing frame is read once, in the order of the file
+            positions, inverse = np.unique(numbers[~cached] % self.num_frames, return_inverse=True)
+            frames[~cached] = self.frames[positions][inverse.reshape(-1)]
+        return frames
+
+    def flush(self):
+        """
+        Write the changes of all the arrays to their files
+        """
+        arrays = [self.actions, self.rewards, self.dones, self.numbers, self.starts, self.counters, self.streams,
+                  self.priorities]
+        if self.frames is not None:
+            arrays.append(self.frames)
+        for array in arrays:
+            array.flush()
 
 
 class PrioritizedReplayBuffer:
-    def __init__(self, maxlen):
-        self.buffer = deque(maxlen=maxlen)
-        self.priorities = deque(maxlen=maxlen)
+    """
+    Replay buffer that samples the experiences in proportion to their priority raised to the priority scale.
+    The scaled priorities are kept in a sum tree and a min tree, so sampling, updating the priorities and
+    finding the smallest of them take O(log N). The largest priority, given to every pushed experience,
+    is the root of a max tree, so it stays exact when the experience that held it is replaced or updated.
+    The experiences are kept in a ring by the storage, the oldest is replaced when the buffer is full
+    """
 
-    def push(self, experience):
+    def __init__(self, maxlen, priority_scale=1.0, storage=None, priorities=None):
+        """
+        :param maxlen: int - capacity of the buffer
+        :param priority_scale: scale factor of the priorities in the trees, sample rebuilds the trees
+        when it is given another one
+        :param storage: ListStorage, FrameStorage or MemmapFrameStorage of capacity maxlen, a ListStorage
+        if not given
+        :param priorities: float32 array of shape (maxlen,) to keep the priorities in, such as the priorities
+        of a MemmapFrameStorage, a new array if not given. The trees are built from the priorities of the
+        experiences already in the storage
+        """
+        self.maxlen = maxlen
+        self.storage = ListStorage(maxlen) if storage is None else storage
+        self.priorities = np.zeros(maxlen, dtype=np.float32) if priorities is None else priorities
+        self.priority_scale = priority_scale
+        self.sum_tree = SumTree(maxlen)
+        self.min_tree = MinTree(maxlen)
+        self.max_tree = MaxTree(maxlen)
+        if len(self.storage):
+            self.rebuild_trees()
+
+    def __len__(self):
+        return len(self.storage)
+
+    def push(self, experience, stream=0):
         """
         Push the given experience to the memory buffer
         :param experience: Experience object contains ('state', 'action', 'next_state', 'reward', 'done')
+        :param stream: int - index of the env the experience was played in, see FrameStorage
         """
-        self.buffer.append(experience)
-        self.priorities.append(max(self.priorities, default=1))
+        priority = self.max_tree.root() if len(self.storage) else 1.
+        index = self.storage.add(experience, stream)
+        self.priorities[index] = priority
+        priority = float(self.priorities[index])
+        scaled = priority ** self.priority_scale
+        self.sum_tree.update_one(index, scaled)
+        self.min_tree.update_one(index, scaled)
+        self.max_tree.update_one(index, priority)
 
-    def get_probabilities(self, priority_scale):
+    def _set(self, indices, priorities):
+        self.priorities[indices] = priorities
+        # Read back so a repeated index has the same priority in the array and in the trees
+        priorities = self.priorities[indices].astype(np.float64)
+        scaled = priorities ** self.priority_scale
+        self.sum_tree.update(indices, scaled)
+        self.min_tree.update(indices, scaled)
+        self.max_tree.update(indices, priorities)
+
+    def rebuild_trees(self):
         """
-        :param priority_scale: scale factor is a number in [0,1]
-        :return: The current sample probabilities
+        Build the trees from the priorities of the experiences in the storage, after the priorities
+        were loaded or changed in place
+        """
+        self.max_tree.build(self.priorities[:len(self.storage)])
+        self._rescale(self.priority_scale)
+
+    def _rescale(self, priority_scale):
+        self.priority_scale = priority_scale
+        scaled = self.priorities[:len(self.storage)].astype(np.float64) ** priority_scale
+        self.sum_tree.build(scaled)
+        self.min_tree.build(scaled)
+
+    def get_probabilities(self, indices):
+        """
+        :param indices: int array - indices of experiences in the buffer
+        :return: The current sample probabilities of the experiences
         """
-        scaled_priorities = np.array(self.priorities) ** priority_scale
-        sample_probabilities = scaled_priorities / sum(scaled_priorities)
-        return sample_probabilities
+        return self.sum_tree[indices] / self.sum_tree.root()
 
-    def get_importance(self, probabilities):
+    def get_importance(self, indices):
         """
-        :param probabilities: sample probabilities
-        :return: The current importance
+        :param indices: int array - indices of experiences in the buffer
+        :return: The importance of the experiences, normalized by the largest importance in the buffer
+        which is the one of the smallest priority
         """
-        importance = 1 / len(self.buffer) * 1 / probabilities
-        importance_normalized = importance / max(importance)
-        return importance_normalized
+        return self.min_tree.root() / self.sum_tree[indices]
 
     def sample(self, batch_size, priority_scale=1.0):
         """
         :param batch_size: Number of samples
         :param priority_scale: scale factor is a number in [0,1]
-        :return: list of samples in size of the given batch_size, there importance
+        :return: samples in size of the given batch_size as returned by the storage, there importance
         and there indices in the memory buffer
         """
-        sample_size = min(len(self.buffer), batch_size)
-        sample_probs = self.get_probabilities(priority_scale)
-        sample_indices = random.choices(range(len(self.buffer)), k=sample_size, weights=sample_probs)
-        samples = [self.buffer[i] for i in sample_indices]
-        importance = self.get_importance(sample_probs[sample_indices])
+        if priority_scale != self.priority_scale:
+            self._rescale(priority_scale)
+        sample_size = min(len(self.storage), batch_size)
+        values = np.random.random_sample(sample_size) * self.sum_tree.root()
+        sample_indices = np.minimum(self.sum_tree.find_prefix_sum(values), len(self.storage) - 1)
+        samples = self.storage.get(sample_indices)
+        importance = self.get_importance(sample_indices)
         return samples, importance, sample_indices
 
     def set_priorities(self, indices, errors, offset=0.1):
         """
          Sets new priorities to the experiences which there indices are given
         """
-        for i, e in zip(indices, errors):
-            self.priorities[i] = abs(e) + offset
+        self._set(np.asarray(indices), np.abs(errors) + offset)
 
     def can_provide_sample(self, batch_size):
         """
         :return: True if there enough samples to sample and false otherwise
         """
-        return len(self.buffer) >= batch_size
+        return len(self.storage) >= batch_size
 
 
 class ReplayMemory:
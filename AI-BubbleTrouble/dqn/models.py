@@ -1,6 +1,7 @@
 import torch.nn as nn
 import torch.nn.functional as F
 from parameters import *
+from features import FEATURE_SIZE
 
 
 class CNN(nn.Module):
@@ -43,3 +44,23 @@ class CNN(nn.Module):
         x = F.relu(self.bn3(self.conv3(x)))
         x = F.relu(self.fc4(x.reshape(x.size(0), -1)))
         return self.head(x)
+
+
+class MLP(nn.Module):
+    def __init__(self, in_features=FEATURE_SIZE, n_actions=4):
+        """
+        Initialize Deep Q Network over the feature vector of the game
+        :param in_features: Size of the input vector
+        :param n_actions: Number of outputs
+        """
+
+        super(MLP, self).__init__()
+        self.fc1 = nn.Linear(in_features, MLP_HIDDEN)
+        self.fc2 = nn.Linear(MLP_HIDDEN, MLP_HIDDEN)
+        self.head = nn.Linear(MLP_HIDDEN, n_actions)
+
+    def forward(self, x):
+        x = x.float()
+        x = F.relu(self.fc1(x.reshape(x.size(0), -1)))
+        x = F.relu(self.fc2(x))
+        return self.head(x)
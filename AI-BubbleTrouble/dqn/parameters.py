@@ -19,6 +19,9 @@ NUM_OF_CHANNELS = 3
 # Number of outputs
 NUM_OF_ACTIONS = 4
 
+# Width of the hidden layers of the MLP used with the feature observations
+MLP_HIDDEN = 256
+
 # Training Parameters
 SKIP_FRAMES = 3
 EPS_START = 1.0
@@ -29,4 +32,12 @@ BATCH_SIZE = 32
 GAMMA = 0.99
 TARGET_UPDATE = 10000
 MEMORY_SIZE = 90000
+# Directory of the memory mapped replay buffer of a run, the buffer is kept in RAM if None
+REPLAY_DIR = None
+# Number of the newest frames of the memory mapped replay buffer that are also kept in RAM
+REPLAY_CACHE_SIZE = 50000
+# Directory the replay memory and the step counters are saved to while training, not saved if None
+REPLAY_CHECKPOINT_DIR = None
+# Number of episodes between saves of the replay memory
+REPLAY_SAVE_EVERY = 20
 NUM_EPISODES = 10000
@@ -0,0 +1,81 @@
+import numpy as np
+
+from settings import *
+from parameters import WIDTH, HEIGHT
+from collision import circle_rect_overlap, hexagon_rect_overlap
+
+# Channels of the observation planes
+BALLS_PLANE = 0
+HEXAGONS_PLANE = 1
+PLAYER_PLANE = 2
+HARPOON_PLANE = 3
+NUM_PLANES = 4
+
+
+def _cell_range(low, high, cell_size, num_cells):
+    # Cells of the given size overlapping the window interval [low, high)
+    first = max(int(low // cell_size), 0)
+    last = min(int(-(-high // cell_size)), num_cells)
+    return first, last
+
+
+class PlaneRenderer:
+    """
+    Draws the balls, hexagons, player and harpoon of a game into separate binary planes at the observation
+    resolution, straight from the game state. A cell of a plane is 1 if the shape of any object of its kind
+    overlaps it, balls are circles and hexagons polygons as in collision
+    """
+
+    def __init__(self, width=WIDTH, height=HEIGHT):
+        """
+        :param width: int - width of the planes
+        :param height: int - height of the planes
+        """
+        self.width = width
+        self.height = height
+        self.cell_width = WINDOWWIDTH / width
+        self.cell_height = WINDOWHEIGHT / height
+        self.cell_left = np.arange(width) * self.cell_width
+        self.cell_top = (np.arange(height) * self.cell_height)[:, None]
+        self.planes = np.zeros((height, width, NUM_PLANES), dtype=np.uint8)
+
+    def _cells(self, rect):
+        rows = _cell_range(rect.top, rect.bottom, self.cell_height, self.height)
+        columns = _cell_range(rect.left, rect.right, self.cell_width, self.width)
+        return slice(*rows), slice(*columns)
+
+    def _draw_bubble(self, plane, bubble, is_hexagon):
+        rows, columns = self._cells(bubble.rect)
+        left, top = self.cell_left[columns], self.cell_top[rows]
+        right, bottom = left + self.cell_width, top + self.cell_height
+        rect = bubble.rect
+        if is_hexagon:
+            plane[rows, columns] |= hexagon_rect_overlap(rect.left, rect.top, rect.width, left, top, right, bottom)
+        else:
+            radius = rect.width / 2
+            plane[rows, columns] |= circle_rect_overlap(rect.left + radius, rect.top + radius, radius,
+                                                        left, top, right, bottom)
+
+    def draw(self, game, out=None):
+        """
+        :param game: BubbleTroubleGame
+        :param out: uint8 array of shape (height, width, NUM_PLANES) to draw into, the buffer of the renderer
+        if not given
+        :return: out, or the buffer of the renderer that is overwritten by the next call
+        """
+        out = self.planes if out is None else out
+        out.fill(0)
+        for ball in game.balls:
+            self._draw_bubble(out[..., BALLS_PLANE], ball, False)
+        for hexagon in game.hexagons:
+            self._draw_bubble(out[..., HEXAGONS_PLANE], hexagon, True)
+        player = game.player
+        rows, columns = self._cells(player.rect)
+        out[rows, columns, PLAYER_PLANE] = 1
+        weapon = player.weapon
+        if weapon.is_active:
+            # The harpoon is the vertical segment at the center of the weapon
+            rows = slice(*_cell_range(weapon.rect.top, weapon.rect.bottom, self.cell_height, self.height))
+            column = min(int(weapon.rect.centerx // self.cell_width), self.width - 1)
+            out[rows, column, HARPOON_PLANE] = 1
+        return out
@@ -1,5 +1,3 @@
-import math
-
 import torch
 import numpy as np
 from collections import namedtuple
@@ -37,18 +35,32 @@ def load_model(policy, target, optimizer, path):
 
 def get_state(obs):
     """
-    Converting the given observation to Tensor and returns it
+    Converting the given observation to Tensor and returns it, the Tensor shares the memory of
+    the observation when it is an array
     """
-    state = np.array(obs)
+    state = np.asarray(obs)
     state = state.transpose((2, 0, 1))
     state = torch.from_numpy(state)
     return state.unsqueeze(0)
 
 
+def get_features_state(obs):
+    """
+    Converting the given feature vector to a Tensor with a batch dimension and returns it
+    """
+    return torch.from_numpy(np.asarray(obs)).unsqueeze(0)
+
+
 def extract_tensors(experiences, device):
     """
     Extracts the given experiences into tuple of Tensors and returns it
+    :param experiences: list of Experience, or an Experience of batches as sampled from a FrameStorage
     """
+    if isinstance(experiences, Experience):
+        batch = experiences
+        return (batch.state.to(device), batch.action.to(device).unsqueeze(1), batch.reward.to(device),
+                batch.next_state.to(device), batch.done.to(device, torch.float).unsqueeze(1))
+
     # Convert batch of Experiences to Experience of batches
     batch = Experience(*zip(*experiences))
     actions_b = tuple((map(lambda a: torch.tensor([[a]], device=device), batch.action)))
@@ -74,45 +86,6 @@ def get_loss(current_q_values, target_q_values, importance, batch_size, device):
     return errors, loss
 
 
-def get_euclidian_closest_bubble(game, bubbles_list):
-    """
-    :return: euclidean distance of agent and closest bubble from bubbles_list
-    """
-    bubbles_dist = [euclidean_dist_bubble_and_player(bubble, game.players[0]) for bubble in bubbles_list]
-    min_dist_bubble_index = int(np.argmin(np.array(bubbles_dist)))
-    return bubbles_list[min_dist_bubble_index], bubbles_dist[min_dist_bubble_index]
-
-
-def get_x_axis_closest_bubble(game, bubbles_list):
-    """
-    :return: X axis distance of agent and closest bubble from bubbles_list
-    """
-    bubbles_dist = [dist_from_bubble_and_player(bubble, game.players[0], axis=0) for bubble in bubbles_list]
-    min_dist_bubble_index = int(np.argmin(np.array(bubbles_dist)))
-    return bubbles_list[min_dist_bubble_index], bubbles_dist[min_dist_bubble_index]
-
-
-def dist_from_bubble_and_player(bubble, player, axis=0):
-    """
-    :return: dist of player from bubble in axis
-    """
-    if axis == 0:
-        player_spot = player.rect.centerx
-        pos_bubble_spot = bubble.rect.left
-        neg_bubble_spot = bubble.rect.right
-        return min(abs(player_spot - pos_bubble_spot), abs(player_spot - neg_bubble_spot))
-    else:
-        return abs(bubble.rect.bottom - player.rect.top)
-
-
-def euclidean_dist_bubble_and_player(bubble, player):
-    """
-    :return: euclidean dist of player from bubble
-    """
-    return math.sqrt(math.pow(dist_from_bubble_and_player(bubble, player, 0), 2) + math.pow(
-        dist_from_bubble_and_player(bubble, player, 1), 2))
-
-
 def plot(values, moving_avg_period, val_type):
     plt.figure(2)
     plt.clf()
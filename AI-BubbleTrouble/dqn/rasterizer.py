@@ -0,0 +1,124 @@
+import numpy as np
+import cv2 as cv
+import pygame
+
+from settings import *
+from parameters import WIDTH, HEIGHT
+
+
+def area_weights(source_size, target_size):
+    """
+    Weights of cv.resize with INTER_AREA along a single axis, row i holds the part of every source
+    pixel that is covered by target pixel i, divided by the number of source pixels per target pixel
+    :param source_size: int - number of source pixels
+    :param target_size: int - number of target pixels, at most source_size
+    :return: float32 array of shape (target_size, source_size)
+    """
+    scale = source_size / target_size
+    edges = np.arange(target_size + 1) * scale
+    pixels = np.arange(source_size)
+    covered = np.minimum(edges[1:, None], pixels + 1) - np.maximum(edges[:-1, None], pixels)
+    return (np.maximum(covered, 0) / scale).astype(np.float32)
+
+
+def _covered_range(weights):
+    # First and last + 1 target pixel covering every source pixel
+    covering = weights > 0
+    first = covering.argmax(axis=0)
+    last = len(weights) - covering[::-1].argmax(axis=0)
+    return first, last
+
+
+class Rasterizer:
+    """
+    Draws the observation of a game straight from its state at the observation resolution.
+    Matches the gray, area resized screen of BubbleTroubleEnv: the darkness (255 - gray) of every sprite
+    on the white background is resized with the INTER_AREA weights and subtracted from white.
+    The sprites under others are hidden by the transparency of the ones drawn over them, in the order
+    of BubbleTroubleEnv.draw_world
+    """
+
+    def __init__(self, width=WIDTH, height=HEIGHT):
+        """
+        :param width: int - width of the observation
+        :param height: int - height of the observation
+        """
+        self.width = width
+        self.height = height
+        self.weights_x = area_weights(WINDOWWIDTH, width).T.copy()
+        self.weights_y = area_weights(WINDOWHEIGHT, height)
+        self.range_x = _covered_range(self.weights_x.T)
+        self.range_y = _covered_range(self.weights_y)
+        self.darkness = np.zeros((height, width), dtype=np.float32)
+        self.frame = np.zeros((height, width), dtype=np.uint8)
+        self._sprite_darkness = {}
+        self._sprite_transparency = {}
+
+    def _get_sprite_darkness(self, image):
+        # The images are shared by all the sprites of the same kind and size, so they key the cache
+        darkness = self._sprite_darkness.get(image)
+        if darkness is None:
+            surface = pygame.Surface(image.get_size())
+            surface.fill(WHITE)
+            surface.blit(image, (0, 0))
+            rgb = np.ascontiguousarray(pygame.surfarray.array3d(surface).swapaxes(0, 1))
+            darkness = 255 - cv.cvtColor(rgb, cv.COLOR_RGB2GRAY).astype(np.float32)
+            self._sprite_darkness[image] = darkness
+        return darkness
+
+    def _get_sprite_transparency(self, image):
+        transparency = self._sprite_transparency.get(image)
+        if transparency is None:
+            if image.get_colorkey() is None:
+                alpha = pygame.surfarray.array_alpha(image)
+            else:
+                alpha = pygame.surfarray.array_colorkey(image)
+            transparency = 1 - alpha.T / np.float32(255)
+            self._sprite_transparency[image] = transparency
+        return transparency
+
+    def _draw_sprite(self, image, rect, covers=()):
+        # covers are the (image, rect) of the sprites drawn on top of this one, they hide the pixels under them
+        darkness = self._get_sprite_darkness(image)
+        left, top = max(rect.left, 0), max(rect.top, 0)
+        right, bottom = min(rect.right, WINDOWWIDTH), min(rect.bottom, WINDOWHEIGHT)
+        if left >= right or top >= bottom:
+            return
+        rows = slice(self.range_y[0][top], self.range_y[1][bottom - 1])
+        columns = slice(self.range_x[0][left], self.range_x[1][right - 1])
+        visible = darkness[top - rect.top:bottom - rect.top, left - rect.left:right - rect.left]
+        for cover_image, cover_rect in covers:
+            hidden = pygame.Rect(left, top, right - left, bottom - top).clip(cover_rect)
+            if hidden.width and hidden.height:
+                if visible.base is darkness:
+                    visible = visible.copy()
+                visible[hidden.top - top:hidden.bottom - top, hidden.left - left:hidden.right - left] *= \
+                    self._get_sprite_transparency(cover_image)[
+                        hidden.top - cover_rect.top:hidden.bottom - cover_rect.top,
+                        hidden.left - cover_rect.left:hidden.right - cover_rect.left]
+        self.darkness[rows, columns] += \
+            self.weights_y[rows, top:bottom] @ visible @ self.weights_x[left:right, columns]
+
+    def draw(self, game, out=None):
+        """
+        Draw the hexagons, balls, weapon and player of the given game
+        :param game: BubbleTroubleGame
+        :param out: uint8 array of shape (height, width) to draw into, the buffer of the rasterizer if not given
+        :return: out, or the buffer of the rasterizer that is overwritten by the next call
+        """
+        self.darkness.fill(0)
+        sprites = game.hexagons + game.balls
+        if game.player.weapon.is_active:
+            sprites.append(game.player.weapon)
+        sprites.append(game.player)
+        rects = [sprite.rect for sprite in sprites]
+        for index, sprite in enumerate(sprites):
+            above = index + 1
+            covers = [(sprites[above + cover].image, rects[above + cover])
+                      for cover in sprite.rect.collidelistall(rects[above:])]
+            self._draw_sprite(sprite.image, sprite.rect, covers)
+        np.subtract(255.5, self.darkness, out=self.darkness)
+        np.clip(self.darkness, 0, 255, out=self.darkness)
+        out = self.frame if out is None else out
+        np.copyto(out, self.darkness, casting='unsafe')
+        return out
@@ -0,0 +1,87 @@
+import numpy as np
+
+# Axes of the distance queries, None is the euclidean distance
+AXIS_X = 0
+AXIS_Y = 1
+
+
+class BubbleQuery:
+    """
+    Spatial queries of the bubbles of a game around its player.
+    The rects of the bubbles are read into arrays once and every query is vectorized over them, so the
+    query holds for the frame it was built in. The distance of a bubble along the x axis is from the center
+    of the player to the nearer side of the bubble, along the y axis from the bottom of the bubble to the top
+    of the player, and the euclidean distance combines the two
+    """
+
+    def __init__(self, bubbles, player):
+        """
+        :param bubbles: list of the bubbles, the balls of the game followed by its hexagons
+        :param player: Player
+        """
+        self.bubbles = bubbles
+        # Signed offsets of the left, right and bottom of every bubble from the player, made absolute in place
+        offsets = np.array([(bubble.rect.left, bubble.rect.right, bubble.rect.bottom) for bubble in bubbles],
+                           dtype=np.int64).reshape((-1, 3))
+        offsets -= (player.rect.centerx, player.rect.centerx, player.rect.top)
+        np.abs(offsets, out=offsets)
+        self.distance_x = np.minimum(offsets[:, 0], offsets[:, 1])
+        self.distance_y = offsets[:, 2]
+        self._distance = None
+        self._closest = {}
+
+    @classmethod
+    def from_game(cls, game):
+        """
+        :param game: BubbleTroubleGame
+        :return: BubbleQuery of the balls and hexagons of the game around its first player
+        """
+        return cls(game.balls + game.hexagons, game.players[0])
+
+    def __len__(self):
+        return len(self.bubbles)
+
+    def distances(self, axis=None):
+        """
+        :param axis: AXIS_X, AXIS_Y or None for the euclidean distance
+        :return: array of the distances of all the bubbles, in the order of the bubbles
+        """
+        if axis == AXIS_X:
+            return self.distance_x
+        if axis == AXIS_Y:
+            return self.distance_y
+        if self._distance is None:
+            self._distance = np.sqrt(self.distance_x * self.distance_x + self.distance_y * self.distance_y)
+        return self._distance
+
+    def closest(self, axis=None):
+        """
+        :param axis: AXIS_X, AXIS_Y or None for the euclidean distance
+        :return: the closest bubble and its distance, (None, 0) if there are no bubbles.
+        Of bubbles at the same distance the first one is returned
+        """
+        if not self.bubbles:
+            return None, 0
+        if axis not in self._closest:
+            distances = self.distances(axis)
+            index = int(np.argmin(distances))
+            self._closest[axis] = self.bubbles[index], distances[index].item()
+        return self._closest[axis]
+
+    def nearest(self, k, axis=None):
+        """
+        :param k: int - number of bubbles
+        :param axis: AXIS_X, AXIS_Y or None for the euclidean distance
+        :return: list of the (bubble, distance) of the k closest bubbles, closest first
+        """
+        distances = self.distances(axis)
+        order = np.argsort(distances, kind='stable')[:k]
+        return [(self.bubbles[index], distances[index].item()) for index in order]
+
+    def within_radius(self, radius, axis=None):
+        """
+        :param radius: largest distance of a returned bubble
+        :param axis: AXIS_X, AXIS_Y or None for the euclidean distance
+        :return: list of the bubbles at most radius away, in the order of the bubbles
+        """
+        return [self.bubbles[index] for index in np.flatnonzero(self.distances(axis) <= radius)]
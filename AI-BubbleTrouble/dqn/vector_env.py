@@ -0,0 +1,419 @@
+import gym
+import numpy as np
+import pygame
+
+from settings import *
+from physics import move_bubbles
+from assets import get_mask
+from collision import bubble_rect_overlap, ANALYTIC, COLLISION_MODES
+from levels import get_catalog, X, Y, SIZE, SPEED_X, SPEED_Y
+from snapshot import LEFT, TOP
+from start_states import StartStatePool
+from env import DEFAULT_REWARDS, ACTION_LEFT, ACTION_RIGHT, ACTION_FIRE, ACTION_IDLE
+from features import FEATURE_SIZE, encode_features
+from legal_actions import TOO_LOW, TOO_CLOSE, TOO_FAR, TOO_FAR_X
+
+BALLS = 0
+HEXAGONS = 1
+BUBBLE_IMAGES = ('ball.png', 'hexagon.png')
+
+PLAYER_HEIGHT_PX, PLAYER_WIDTH_PX = PLAYER_SHAPE
+WEAPON_HEIGHT_PX, WEAPON_WIDTH_PX = WEAPON_SHAPE
+PLAYER_TOP = WINDOWHEIGHT - PLAYER_HEIGHT_PX
+PLAYER_START = int(WINDOWWIDTH / 2) - PLAYER_WIDTH_PX // 2
+
+# Gravity of every bubble kind, shaped to broadcast over (games, kinds, slots)
+GRAVITY_BY_KIND = np.array([GRAVITY, 0]).reshape((1, 2, 1))
+IS_HEXAGON_BY_KIND = np.array([False, True]).reshape((1, 2, 1))
+# Distance of the empty slots in the legal action rules
+NO_DISTANCE = np.iinfo(np.int64).max
+
+
+def _load_mask(image_name, size=None):
+    # Cached pixel mask of the given image as a bool array indexed by [y, x]
+    mask = get_mask(image_name, size)
+    width, height = mask.get_size()
+    return np.array([[mask.get_at((x, y)) for x in range(width)] for y in range(height)], dtype=bool)
+
+
+def _catalog_capacity(levels):
+    # A bubble of size s is split into at most 2 ** (s - 1) bubbles at the same time, so no level of
+    # the catalog ever holds more bubbles of a kind than this
+    return max(int(np.sum(2 ** (bubbles[:, SIZE] - 1))) for template in levels.values()
+               for bubbles in (template.balls, template.hexagons))
+
+
+def _masks_overlap(mask_a, left_a, top_a, mask_b, left_b, top_b):
+    # Same test as pygame.sprite.collide_mask for masks placed at the given top left corners
+    left, top = max(left_a, left_b), max(top_a, top_b)
+    right = min(left_a + mask_a.shape[1], left_b + mask_b.shape[1])
+    bottom = min(top_a + mask_a.shape[0], top_b + mask_b.shape[0])
+    if left >= right or top >= bottom:
+        return False
+    area_a = mask_a[top - top_a:bottom - top_a, left - left_a:right - left_a]
+    area_b = mask_b[top - top_b:bottom - top_b, left - left_b:right - left_b]
+    return bool(np.any(area_a & area_b))
+
+
+class VectorBubbleTroubleEnv:
+    """
+    N independent Bubble Trouble games stepped in lockstep with one action array.
+    The state of all the games is kept in batched NumPy arrays, no game objects, sprites or pygame
+    surfaces are created, and follows the rules of BubbleTroubleGame frame for frame.
+    With skip and ep_live a step is that of a features BubbleTroubleEnv in the SkipEnv and EpisodicLifeEnv
+    wrappers of make_env. Games that are done are reset automatically, like the envs of AsyncBubbleTroubleEnv
+    """
+
+    def __init__(self, num_envs, rewards=None, capacity=None, collision='mask', skip=1, ep_live=False,
+                 start_variants=0, seed=None):
+        """
+        :param num_envs: int - number of games
+        :param rewards: dict - reward of every event, DEFAULT_REWARDS if not given
+        :param capacity: int - maximal number of bubbles of each kind in a single game, the most any level
+        of the catalog may hold if not given
+        :param collision: 'mask' for the pixel masks of BubbleTroubleGame or 'analytic' for geometric tests
+        :param skip: int - number of frames every action is repeated
+        :param ep_live: if True the episode of a game ends when it loses a life and its level is restarted
+        :param start_variants: number of jittered start states of every level, a reset game starts from a random
+        one of them as in BubbleTroubleEnv.reset
+        :param seed: seed of the jittered start states and of the random choice of them
+        """
+        if collision not in COLLISION_MODES:
+            raise ValueError('collision must be one of {}'.format(COLLISION_MODES))
+        pygame.init()
+        self.levels = get_catalog()
+        required = _catalog_capacity(self.levels)
+        if capacity is None:
+            capacity = required
+        elif capacity < required:
+            raise ValueError('capacity must be at least {}, the most bubbles of a kind in a level'.format(required))
+        self.collision = collision
+        self.num_envs = num_envs
+        self.capacity = capacity
+        self.skip = skip
+        self.ep_live = ep_live
+        self.rewards = rewards if rewards else DEFAULT_REWARDS
+        self.action_space = gym.spaces.Discrete(4)
+        # Without variants every start state is that of the level template
+        self.start_pool = StartStatePool(variants=start_variants, seed=seed) if start_variants else None
+        self.bubble_masks = [[None] + [_load_mask(name, (size * SIZE_TO_PIXELS, size * SIZE_TO_PIXELS))
+                                       for size in range(1, MAX_BALL_SIZE + 1)] for name in BUBBLE_IMAGES]
+        self.player_mask = _load_mask('player.png')
+
+        shape = (num_envs, 2, capacity)
+        self.count = np.zeros((num_envs, 2), dtype=np.int64)
+        self.left = np.zeros(shape, dtype=np.int64)
+        self.top = np.zeros(shape, dtype=np.int64)
+        self.speed_x = np.zeros(shape, dtype=np.int64)
+        self.speed_y = np.zeros(shape, dtype=np.int64)
+        self.extent = np.zeros(shape, dtype=np.int64)
+
+        self.player_left = np.zeros(num_envs, dtype=np.int64)
+        self.moving = np.zeros(num_envs, dtype=np.int64)
+        self.weapon_active = np.zeros(num_envs, dtype=bool)
+        self.weapon_left = np.zeros(num_envs, dtype=np.int64)
+        self.weapon_top = np.zeros(num_envs, dtype=np.int64)
+
+        self.lives = np.zeros(num_envs, dtype=np.int64)
+        self.score = np.zeros(num_envs, dtype=np.int64)
+        self.previous_score = np.zeros(num_envs, dtype=np.int64)
+        self.level = np.ones(num_envs, dtype=np.int64)
+        self.frames = np.zeros(num_envs, dtype=np.int64)
+        self.frame_limit = np.zeros(num_envs, dtype=np.int64)
+        self.n_steps = np.zeros(num_envs, dtype=np.int64)
+
+        self.is_alive = np.ones(num_envs, dtype=bool)
+        self.dead_player = np.zeros(num_envs, dtype=bool)
+        self.game_over = np.zeros(num_envs, dtype=bool)
+        self.level_completed = np.zeros(num_envs, dtype=bool)
+        self.is_completed = np.zeros(num_envs, dtype=bool)
+
+        self.observations = np.zeros((num_envs, FEATURE_SIZE), dtype=np.float32)
+        self.legal_masks = np.zeros((num_envs, self.action_space.n), dtype=bool)
+
+    def reset(self, level=1):
+        """
+        Reset all the games
+        :param level: int - level to start from, in [1, MAX_LEVEL]
+        :return: observations of all the games, the array is overwritten by the next step
+        """
+        self._reset_games(np.arange(self.num_envs), level)
+        return self._observe()
+
+    def step(self, actions):
+        """
+        Execute a single step of all the games, the games that are done are reset and the returned
+        observation of such a game is the first observation of its next episode
+        :param actions: int array of shape (N,) - action of every game
+        :return: observations (N, FEATURE_SIZE), rewards (N,), dones (N,), infos
+        """
+        actions = np.asarray(actions)
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        lives = self.lives.copy()
+        for _ in range(self.skip):
+            self.n_steps += 1
+            self._apply_actions(actions)
+            self._update()
+            # A game that is over keeps running until the end of the skip, it gets no rewards and is reset below
+            rewards += ~dones * self._fitness(actions, ~self.is_alive, self.is_completed,
+                                              self.score != self.previous_score)
+            self.previous_score[:] = self.score
+            dones |= self.game_over | self.is_completed
+
+        if dones.any():
+            self._reset_games(np.flatnonzero(dones))
+        if self.ep_live:
+            lost_life = ~dones & (self.lives < lives)
+            for game in np.flatnonzero(lost_life):
+                self._load_level(game, self.level[game])
+            dones |= lost_life
+        return self._observe(), rewards, dones, [{} for _ in range(self.num_envs)]
+
+    def get_legal_actions(self):
+        """
+        :return: list of the legal actions of every game, as given by legal_actions.get_legal_actions
+        """
+        return [np.flatnonzero(mask).tolist() for mask in self.legal_masks]
+
+    def get_legal_masks(self):
+        """
+        :return: bool array of shape (N, num_actions) - the legal action masks of all the games, overwritten
+        by the next step
+        """
+        return self.legal_masks
+
+    def close(self):
+        pass
+
+    def _update_legal_masks(self):
+        # Same rules as legal_actions.get_legal_actions with the distances of spatial.BubbleQuery, the
+        # squared euclidean distances keep the order and the ties of the distances of the query
+        rows = np.arange(self.num_envs)
+        alive = self._alive_slots().reshape((self.num_envs, -1))
+        left, top, extent = (values.reshape((self.num_envs, -1)) for values in (self.left, self.top, self.extent))
+        player_center = self.player_left + PLAYER_WIDTH_PX // 2
+        offsets_x = left - player_center[:, None]
+        distance_x = np.minimum(np.abs(offsets_x), np.abs(offsets_x + extent))
+        distance_y = np.abs(top + extent - PLAYER_TOP)
+        distance = np.where(alive, distance_x * distance_x + distance_y * distance_y, NO_DISTANCE)
+        closest = np.argmin(distance, axis=1)
+        has_bubbles = alive.any(axis=1)
+        closest_x = np.where(has_bubbles, np.where(alive, distance_x, NO_DISTANCE).min(axis=1), 0)
+
+        can_shoot = ~self.weapon_active
+        on_the_left = left[rows, closest] + extent[rows, closest] // 2 <= player_center
+        too_low = WINDOWHEIGHT - (top[rows, closest] + extent[rows, closest] // 2) <= TOO_LOW
+        in_danger = has_bubbles & (distance[rows, closest] < TOO_CLOSE * TOO_CLOSE) & (~can_shoot | too_low)
+        too_far = has_bubbles & ~in_danger & (closest_x > TOO_FAR) & (closest < self.capacity)
+
+        masks = self.legal_masks
+        masks[:, ACTION_LEFT] = self.player_left > 0
+        masks[:, ACTION_RIGHT] = self.player_left + PLAYER_WIDTH_PX < WINDOWWIDTH
+        masks[:, ACTION_FIRE] = can_shoot & (closest_x < TOO_FAR_X)
+        masks[:, ACTION_IDLE] = True
+        masks[in_danger | too_far] = False
+        masks[in_danger, np.where(on_the_left, ACTION_RIGHT, ACTION_LEFT)[in_danger]] = True
+        masks[in_danger, ACTION_FIRE] = can_shoot[in_danger]
+        masks[too_far, np.where(on_the_left, ACTION_LEFT, ACTION_RIGHT)[too_far]] = True
+
+    def _observe(self):
+        self._update_legal_masks()
+        alive = self._alive_slots().reshape((self.num_envs, -1))
+        is_hexagon = np.zeros(self.left.shape, dtype=bool)
+        is_hexagon[:, HEXAGONS] = True
+
+        def flat(values):
+            return values.reshape((self.num_envs, -1))
+
+        return encode_features(self.observations, alive, flat(is_hexagon), flat(self.left), flat(self.top),
+                               flat(self.extent), flat(self.speed_x), flat(self.speed_y), self.player_left,
+                               self.weapon_active, self.weapon_top, self.frame_limit - self.frames)
+
+    def _fitness(self, actions, dead, win, score_change):
+        fitness = np.full(self.num_envs, self.rewards['step'], dtype=np.float32)
+        fitness += np.where(actions == ACTION_FIRE, self.rewards['fire'],
+                            np.where(actions != ACTION_IDLE, self.rewards['moving'], 0))
+        fitness += dead * self.rewards['death']
+        fitness += win * self.rewards['win']
+        fitness += score_change * self.rewards['score']
+        return fitness
+
+    def _alive_slots(self):
+        return np.arange(self.capacity) < self.count[..., None]
+
+    def _reset_games(self, games, level=1):
+        # Same as creating a new BubbleTroubleGame and loading the given level
+        self.lives[games] = STARTING_LIVES
+        self.score[games] = 0
+        self.previous_score[games] = 0
+        self.moving[games] = 0
+        self.n_steps[games] = 0
+        self.game_over[games] = False
+        self.is_completed[games] = False
+        for game in games:
+            self._load_level(game, level, self.start_pool.sample(level) if self.start_pool else None)
+
+    def _load_level(self, game, level, start=None):
+        # The bubbles are copied from the level template into the game's slots, or from the given GameSnapshot
+        # of the start of the level. Its bubble columns are those of the template with the top left corner in
+        # place of the center
+        template = self.levels[level]
+        self.left[game] = self.top[game] = self.speed_x[game] = self.speed_y[game] = self.extent[game] = 0
+        for kind, bubbles in enumerate((template.balls, template.hexagons) if start is None else
+                                       (start.balls, start.hexagons)):
+            count = len(bubbles)
+            extent = bubbles[:, SIZE] * SIZE_TO_PIXELS
+            if start is None:
+                self.left[game, kind, :count] = bubbles[:, X] - extent // 2
+                self.top[game, kind, :count] = bubbles[:, Y] - extent // 2
+            else:
+                self.left[game, kind, :count] = bubbles[:, LEFT]
+                self.top[game, kind, :count] = bubbles[:, TOP]
+            self.speed_x[game, kind, :count] = bubbles[:, SPEED_X]
+            self.speed_y[game, kind, :count] = bubbles[:, SPEED_Y]
+            self.extent[game, kind, :count] = extent
+            self.count[game, kind] = count
+        self.player_left[game] = PLAYER_START
+        self.weapon_active[game] = False
+        self.is_alive[game] = True
+        self.dead_player[game] = False
+        self.level_completed[game] = False
+        self.level[game] = level
+        self.frames[game] = 0
+        self.frame_limit[game] = template.time * FPS
+
+    def _add_bubble(self, game, kind, x, y, size, speed_x, speed_y):
+        # Same placement as Bubble.__init__, x and y are the center of the bubble
+        slot = self.count[game, kind]
+        extent = size * SIZE_TO_PIXELS
+        self.left[game, kind, slot] = x - extent // 2
+        self.top[game, kind, slot] = y - extent // 2
+        self.speed_x[game, kind, slot] = speed_x
+        self.speed_y[game, kind, slot] = speed_y
+        self.extent[game, kind, slot] = extent
+        self.count[game, kind] += 1
+
+    def _remove_bubble(self, game, kind, slot):
+        last = self.count[game, kind] - 1
+        for values in (self.left, self.top, self.speed_x, self.speed_y, self.extent):
+            values[game, kind, slot:last] = values[game, kind, slot + 1:last + 1]
+            values[game, kind, last] = 0
+        self.count[game, kind] = last
+
+    def _apply_actions(self, actions):
+        # Same as BubbleTroubleEnv.handle_key for every game
+        self.moving[:] = 0
+        self.moving[actions == ACTION_LEFT] = -1
+        self.moving[actions == ACTION_RIGHT] = 1
+        shoot = (actions == ACTION_FIRE) & ~self.weapon_active
+        self.weapon_left[shoot] = self.player_left[shoot] + PLAYER_WIDTH_PX // 2 - WEAPON_WIDTH_PX // 2
+        self.weapon_top[shoot] = PLAYER_TOP
+        self.weapon_active |= shoot
+
+    def _update(self):
+        # Same as BubbleTroubleGame.update for every game
+        for game in np.flatnonzero(self.level_completed & ~self.is_completed):
+            self._load_level(game, self.level[game] + 1)
+        for game in np.flatnonzero(self.dead_player):
+            self._load_level(game, self.level[game])
+
+        self.frames += 1
+        for game in np.flatnonzero(self.frames == self.frame_limit):
+            self._decrease_lives(game)
+
+        self._check_for_collisions()
+        alive = self._alive_slots()
+        move_bubbles(self.left, self.top, self.speed_x, self.speed_y, self.extent, GRAVITY_BY_KIND * alive)
+
+        player_right = self.player_left + PLAYER_WIDTH_PX
+        self.player_left -= PLAYER_SPEED * ((self.moving == -1) & (self.player_left >= 0))
+        self.player_left += PLAYER_SPEED * ((self.moving == 1) & (player_right <= WINDOWWIDTH))
+        expired = self.weapon_active & (self.weapon_top <= 0)
+        self.weapon_top -= WEAPON_SPEED * (self.weapon_active & ~expired)
+        self.weapon_active &= ~expired
+
+        empty = self.count.sum(axis=1) == 0
+        self.level_completed |= empty
+        self.is_completed |= empty & (self.level == MAX_LEVEL)
+
+    def _check_for_collisions(self):
+        # Candidates are found by bounding boxes for all the games at once, the games with candidates
+        # are then resolved one by one in the order of BubbleTroubleGame._check_for_collisions
+        alive = self._alive_slots()
+        if self.collision == ANALYTIC:
+            weapon_hits, player_hits = self._analytic_hits(alive)
+        else:
+            weapon_hits, player_hits = self._bounding_box_hits(alive)
+        for game in np.flatnonzero((weapon_hits | player_hits).any(axis=(1, 2))):
+            for kind in (BALLS, HEXAGONS):
+                self._check_for_bubble_collision(game, kind, weapon_hits[game, kind], player_hits[game, kind])
+
+    def _bounding_box_hits(self, alive):
+        right = self.left + self.extent
+        bottom = self.top + self.extent
+
+        weapon_left = self.weapon_left[:, None, None]
+        weapon_top = self.weapon_top[:, None, None]
+        weapon_hits = alive & self.weapon_active[:, None, None] & \
+            (self.left < weapon_left + WEAPON_WIDTH_PX) & (right > weapon_left) & \
+            (self.top < weapon_top + WEAPON_HEIGHT_PX) & (bottom > weapon_top)
+
+        player_left = self.player_left[:, None, None]
+        player_hits = alive & (self.left < player_left + PLAYER_WIDTH_PX) & (right > player_left) & \
+            (self.top < PLAYER_TOP + PLAYER_HEIGHT_PX) & (bottom > PLAYER_TOP)
+        return weapon_hits, player_hits
+
+    def _analytic_hits(self, alive):
+        weapon_left = self.weapon_left[:, None, None]
+        weapon_top = self.weapon_top[:, None, None]
+        weapon_hits = alive & self.weapon_active[:, None, None] & bubble_rect_overlap(
+            IS_HEXAGON_BY_KIND, self.left, self.top, self.extent, weapon_left, weapon_top,
+            weapon_left + WEAPON_WIDTH_PX, weapon_top + WEAPON_HEIGHT_PX)
+
+        player_left = self.player_left[:, None, None]
+        player_hits = alive & bubble_rect_overlap(
+            IS_HEXAGON_BY_KIND, self.left, self.top, self.extent, player_left, PLAYER_TOP,
+            player_left + PLAYER_WIDTH_PX, PLAYER_TOP + PLAYER_HEIGHT_PX)
+        return weapon_hits, player_hits
+
+    def _check_for_bubble_collision(self, game, kind, weapon_hits, player_hits):
+        for slot in np.flatnonzero(weapon_hits | player_hits):
+            if weapon_hits[slot] and self.weapon_active[game]:
+                self.weapon_active[game] = False
+                self.score[game] += 1
+                self._split_bubble(game, kind, slot)
+                return
+            if player_hits[slot] and (self.collision == ANALYTIC or self._player_mask_hit(game, kind, slot)):
+                self.is_alive[game] = False
+                self._decrease_lives(game)
+                return
+
+    def _player_mask_hit(self, game, kind, slot):
+        size = self.extent[game, kind, slot] // SIZE_TO_PIXELS
+        return _masks_overlap(self.bubble_masks[kind][size], self.left[game, kind, slot], self.top[game, kind, slot],
+                              self.player_mask, self.player_left[game], PLAYER_TOP)
+
+    def _split_bubble(self, game, kind, slot):
+        # Same as BubbleTroubleGame._split_ball and _split_hexagon
+        extent = self.extent[game, kind, slot]
+        size = extent // SIZE_TO_PIXELS
+        left, top = self.left[game, kind, slot], self.top[game, kind, slot]
+        self._remove_bubble(game, kind, slot)
+        if size <= 1:
+            return
+        if kind == BALLS:
+            self._add_bubble(game, kind, left - size ** 2, top - 10, size - 1, -3, -5)
+            self._add_bubble(game, kind, left + size ** 2, top - 10, size - 1, 3, -5)
+        else:
+            center_y = top + extent // 2
+            self._add_bubble(game, kind, left, center_y, size - 1, -3, -5)
+            self._add_bubble(game, kind, left + extent, center_y, size - 1, 3, -5)
+
+    def _decrease_lives(self, game):
+        self.lives[game] -= 1
+        if self.lives[game]:
+            self.dead_player[game] = True
+            self.is_alive[game] = False
+        else:
+            self.game_over[game] = True
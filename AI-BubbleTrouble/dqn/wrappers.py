@@ -0,0 +1,153 @@
+import gym
+import numpy as np
+
+
+class MaxAndSkipEnv(gym.Wrapper):
+    """
+    Repeat every action for skip steps, return the sum of the rewards and the pixel wise max of the last two
+    observations. The observation is a buffer of the wrapper that is overwritten by the next step.
+    The wrapped BubbleTroubleEnv observes only the last two steps, the others advance the game only
+    """
+
+    def __init__(self, env, skip=4):
+        """
+        :param env: gym.Env with array observations
+        :param skip: int - number of steps every action is repeated
+        """
+        super(MaxAndSkipEnv, self).__init__(env)
+        self._skip = skip
+        self._obs_buffer = None
+        self._max_frame = None
+
+    def _allocate(self, obs):
+        if self._max_frame is None or self._max_frame.shape != obs.shape:
+            self._obs_buffer = np.zeros((2,) + obs.shape, dtype=obs.dtype)
+            self._max_frame = np.zeros(obs.shape, dtype=obs.dtype)
+
+    def reset(self, **kwargs):
+        obs = self.env.reset(**kwargs)
+        self._allocate(obs)
+        return obs
+
+    def step(self, action):
+        total_reward = 0.0
+        frames = 0
+        done = False
+        info = {}
+        for i in range(self._skip):
+            observe = i >= self._skip - 2
+            obs, reward, done, info = self.env.step(action, observe=observe)
+            total_reward += reward
+            if done and not observe:
+                obs = self.env.observe()
+            if done or observe:
+                np.copyto(self._obs_buffer[frames], obs)
+                frames += 1
+            if done:
+                break
+        if frames == 1:
+            np.copyto(self._obs_buffer[1], self._obs_buffer[0])
+        np.maximum(self._obs_buffer[0], self._obs_buffer[1], out=self._max_frame)
+        return self._max_frame, total_reward, done, info
+
+
+class SkipEnv(gym.Wrapper):
+    """
+    Repeat every action for skip steps, return the sum of the rewards and the last observation, for
+    observations that are not max pooled such as the features.
+    The wrapped BubbleTroubleEnv observes only the last step, the others advance the game only
+    """
+
+    def __init__(self, env, skip=4):
+        """
+        :param env: gym.Env with array observations
+        :param skip: int - number of steps every action is repeated
+        """
+        super(SkipEnv, self).__init__(env)
+        self._skip = skip
+
+    def step(self, action):
+        total_reward = 0.0
+        for i in range(self._skip):
+            observe = i == self._skip - 1
+            obs, reward, done, info = self.env.step(action, observe=observe)
+            total_reward += reward
+            if done:
+                if not observe:
+                    obs = self.env.observe()
+                break
+        return obs, total_reward, done, info
+
+
+class EpisodicLifeEnv(gym.Wrapper):
+    """
+    End the episode when a life is lost, the next reset restarts the level in place with the remaining
+    lives and the env is fully reset only when the game is over
+    """
+
+    def __init__(self, env):
+        super(EpisodicLifeEnv, self).__init__(env)
+        self.lives = 0
+        self.was_real_done = True
+
+    def step(self, action):
+        obs, reward, done, info = self.env.step(action)
+        self.was_real_done = done
+        lives = self.env.unwrapped.lives()
+        if 0 < lives < self.lives:
+            done = True
+        self.lives = lives
+        return obs, reward, done, info
+
+    def reset(self, **kwargs):
+        if self.was_real_done:
+            obs = self.env.reset(**kwargs)
+        else:
+            obs = self.env.unwrapped.restart_level()
+        self.lives = self.env.unwrapped.lives()
+        return obs
+
+
+class FrameStack(gym.Wrapper):
+    """
+    Stack the last k observations along their last axis.
+    Every frame is written twice into a preallocated ring buffer of 2k frames, so the last k frames are
+    always consecutive and the stack is a view of the buffer. The view is valid until the next step
+    """
+
+    def __init__(self, env, k):
+        """
+        :param env: gym.Env with (height, width, channels) observations
+        :param k: int - number of stacked frames
+        """
+        super(FrameStack, self).__init__(env)
+        self.k = k
+        self._frames = None
+        self._channels = 0
+        self._position = 0
+
+    def _push(self, obs):
+        channels = self._channels
+        for slot in (self._position, self._position + self.k):
+            self._frames[..., slot * channels:(slot + 1) * channels] = obs
+        self._position = (self._position + 1) % self.k
+
+    def _stack(self):
+        # The oldest frame is at the position that is written next
+        channels = self._channels
+        return self._frames[..., self._position * channels:(self._position + self.k) * channels]
+
+    def reset(self, **kwargs):
+        obs = self.env.reset(**kwargs)
+        shape = obs.shape[:-1] + (2 * self.k * obs.shape[-1],)
+        if self._frames is None or self._frames.shape != shape:
+            self._frames = np.zeros(shape, dtype=obs.dtype)
+            self._channels = obs.shape[-1]
+        for _ in range(self.k):
+            self._push(obs)
+        return self._stack()
+
+    def step(self, action):
+        obs, reward, done, info = self.env.step(action)
+        self._push(obs)
+        return self._stack(), reward, done, info
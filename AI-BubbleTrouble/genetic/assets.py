@@ -0,0 +1,37 @@
+import pygame
+
+from settings import *
+
+# Process wide caches keyed by (image name, size)
+_images = {}
+_masks = {}
+
+
+def get_image(image_name, size=None):
+    """
+    Load the given image from the images directory once per process
+    :param image_name: str - file name of the image
+    :param size: (width, height) to scale the image to, None for the original size
+    :return: Surface shared by all the callers, it must not be drawn on
+    """
+    key = (image_name, size)
+    image = _images.get(key)
+    if image is None:
+        if size is None:
+            image = pygame.image.load(IMAGES_PATH + image_name)
+        else:
+            image = pygame.transform.scale(get_image(image_name), size)
+        _images[key] = image
+    return image
+
+
+def get_mask(image_name, size=None):
+    """
+    :return: pygame.mask.Mask of the image returned by get_image for the same arguments
+    """
+    key = (image_name, size)
+    mask = _masks.get(key)
+    if mask is None:
+        mask = pygame.mask.from_surface(get_image(image_name, size))
+        _masks[key] = mask
+    return mask
@@ -1,22 +1,37 @@
 import sys
-from threading import Timer
 import random
-import json
 import numpy as np
 from genetic.bubbles import *
 from genetic.player import *
 from genetic.bonuses import *
 from genetic.settings import *
+from genetic.clock import LevelClock
+from genetic.physics import BubbleArrays
+from genetic.spatial import BubbleQuery
+from genetic.collision import collide_bubble, collide_harpoon, ANALYTIC, COLLISION_MODES
+from genetic.levels import get_level, get_max_level_available, save_max_level_available, \
+    X, Y, SIZE, SPEED_X, SPEED_Y
+from genetic.snapshot import GameSnapshot, pack_bubbles, unpack_bubbles, pack_players, unpack_players, \
+    pack_bonuses, unpack_bonuses, pack_rng, unpack_rng
+
+# Scalars of the game kept in GameSnapshot.state, followed by the frames and limit of the level clock
+SNAPSHOT_STATE = ('level', 'score', 'num_of_shoots', 'game_over', 'level_completed', 'is_running', 'is_completed',
+                  'is_multiplayer', 'is_restarted', 'dead_player', 'fitness_penalty', 'max_level_available')
 
 class Game:
 
-    def __init__(self, level=1):
+    def __init__(self, level=1, collision='mask', seed=None):
+        if collision not in COLLISION_MODES:
+            raise ValueError('collision must be one of {}'.format(COLLISION_MODES))
+        self.collision = collision
+        self.rng = random.Random(seed)
         self.balls = []
         self.hexagons = []
         self.players = [Player()]
         self.bonuses = []
 
         self.positions_of_balls_last_frame = {}
+        self._bubble_query = None
 
         self.score = 0
         self.level = level
@@ -33,14 +48,12 @@ class Game:
 
         self.is_ai = False
         self.fitness_penalty = 0
-
-        with open(APP_PATH + 'max_level_available', 'r') as \
-                max_completed_level_file:
-            max_level_available = max_completed_level_file.read()
-            if max_level_available:
-                self.max_level_available = int(max_level_available)
-            else:
-                self.max_level_available = 1
+        self.clock = LevelClock()
+        self.bubble_arrays = BubbleArrays()
+        self.physics_threshold = MAX_BALLS_AT_ALL_TIME
+        # True while the bubble arrays hold the speeds of the bubbles, see sync_bubbles
+        self.bubbles_in_arrays = False
+        self.max_level_available = get_max_level_available()
 
     def update_positions_balls(self):
         balls = {ball : (ball.rect.centerx,ball.rect.centery) for ball in self.balls}
@@ -66,21 +79,22 @@ class Game:
         return x_approaching,y_approaching
 
 
+    @property
+    def bubble_query(self):
+        """
+        :return: BubbleQuery of the bubbles around the first player in the current
+        frame, built on the first query of the frame
+        """
+        if self._bubble_query is None:
+            self._bubble_query = BubbleQuery.from_game(self)
+        return self._bubble_query
+
     def get_closest_ball_to_player_x_axis(self):
-        closest_ball = None
-        closest_ball_distance = 0
-        for ball in self.balls:
-            user_dist_from_ball = ((ball.rect.centerx - self.players[0].rect.centerx)**2+(ball.rect.centery - self.players[0].rect.centery)**2)**0.5
-            if user_dist_from_ball > closest_ball_distance:
-                closest_ball_distance = user_dist_from_ball
-                closest_ball = ball
-        for hexagon in self.hexagons:
-            user_dist_from_ball = ((hexagon.rect.centerx - self.players[0].rect.centerx)**2+(hexagon.rect.centery - self.players[0].rect.centery)**2)**0.5
-            if user_dist_from_ball > closest_ball_distance:
-                closest_ball_distance = user_dist_from_ball
-                closest_ball = hexagon
-
-        return closest_ball
+        # The trained networks were fed the bubble farthest from the player, by
+        # euclidean distance between the centers, so it is kept
+        ball, distance = self.bubble_query.farthest()
+        self.sync_bubbles()
+        return ball if distance > 0 else None
 
     def get_closest_bonus_to_player_x_axis(self):
         closest_bonus = None
@@ -95,6 +109,8 @@ class Game:
 
     def load_level(self, level):
         self.is_restarted = True
+        self._bubble_query = None
+        self._release_bubble_arrays()
         if self.is_multiplayer and len(self.players) == 1:
             self.players.append(Player('player2.png'))
         self.balls = []
@@ -112,24 +128,63 @@ class Game:
         self.level = level
         if self.level > self.max_level_available:
             self.max_level_available = self.level
-            with open(APP_PATH + 'max_level_available', 'w') as \
-                    max_completed_level_file:
-                max_completed_level_file.write(str(self.max_level_available))
-        with open(APP_PATH + 'levels.json', 'r') as levels_file:
-            levels = json.load(levels_file)
-            level = levels[str(self.level)]
-            self.time_left = level['time']
-            for ball in level['balls']:
-                x, y = ball['x'], ball['y']
-                size = ball['size']
-                speed = ball['speed']
-                self.balls.append(Ball(x, y, size, speed))
-            for hexagon in level['hexagons']:
-                x, y = hexagon['x'], hexagon['y']
-                size = hexagon['size']
-                speed = hexagon['speed']
-                self.hexagons.append(Hexagon(x, y, size, speed))
-        self._start_timer()
+        template = get_level(self.level)
+        self.clock.reset(template.time)
+        for ball in template.balls.tolist():
+            self.balls.append(Ball(ball[X], ball[Y], ball[SIZE],
+                                   [ball[SPEED_X], ball[SPEED_Y]]))
+        for hexagon in template.hexagons.tolist():
+            self.hexagons.append(Hexagon(hexagon[X], hexagon[Y], hexagon[SIZE],
+                                         [hexagon[SPEED_X], hexagon[SPEED_Y]]))
+
+    def save_progress(self):
+        """
+        persists the highest level reached, called when the game ends and not on every level load
+        :return:
+        """
+        save_max_level_available(self.max_level_available)
+
+    @property
+    def time_left(self):
+        return self.clock.time_left
+
+    def snapshot(self):
+        """
+        captures the state of the game without any Surface
+        :return: GameSnapshot - picklable and independent of this game
+        """
+        self.sync_bubbles()
+        state = np.array([getattr(self, name) for name in SNAPSHOT_STATE] +
+                         [self.clock.frames, self.clock.limit], dtype=np.int64)
+        return GameSnapshot(state, pack_bubbles(self.balls),
+                            pack_bubbles(self.hexagons),
+                            pack_players(self.players),
+                            pack_bonuses(self.bonuses, bonus_types),
+                            pack_rng(self.rng))
+
+    def restore(self, snapshot):
+        """
+        brings the game to the state of the given snapshot, any number of
+        games may be restored from the same snapshot
+        :param snapshot: GameSnapshot - returned by snapshot()
+        :return:
+        """
+        state = snapshot.state.tolist()
+        for name, value in zip(SNAPSHOT_STATE, state):
+            setattr(self, name, type(getattr(self, name))(value))
+        self.clock.frames, self.clock.limit = state[len(SNAPSHOT_STATE):]
+        self._release_bubble_arrays()
+        self.balls = unpack_bubbles(snapshot.balls, Ball)
+        self.hexagons = unpack_bubbles(snapshot.hexagons, Hexagon)
+        self.bonuses = unpack_bonuses(snapshot.bonuses, Bonus, bonus_types)
+        if len(self.players) != len(snapshot.players):
+            self.players = [Player('player2.png') if index else Player()
+                            for index in range(len(snapshot.players))]
+        unpack_players(snapshot.players, self.players)
+        unpack_rng(snapshot.rng, self.rng)
+        # The positions are keyed by the sprites that were just replaced
+        self.positions_of_balls_last_frame = {}
+        self._bubble_query = None
 
     def get_time_left(self):
         """
@@ -138,10 +193,6 @@ class Game:
         """
         return int(np.ceil(self.time_left))
 
-
-    def _start_timer(self):
-        self._timer(1, self._tick_second, self.time_left)
-
     def _check_for_collisions(self):
         for player in self.players:
             self._check_for_bubble_collision(self.balls, True, player)
@@ -167,8 +218,7 @@ class Game:
 
     def _check_for_bubble_collision(self, bubbles, is_ball, player):
         for bubble_index, bubble in enumerate(bubbles):
-            if pygame.sprite.collide_rect(bubble, player.weapon) \
-                    and player.weapon.is_active:
+            if self._check_weapon_ball_collision(bubble, is_ball, player):
                 self.add_to_score(50)
                 player.weapon.is_active = False
                 if is_ball:
@@ -176,12 +226,24 @@ class Game:
                 else:
                     self._split_hexagon(bubble_index)
                 return True
-            if pygame.sprite.collide_mask(bubble, player):
+            if self._check_player_ball_collision(bubble, is_ball, player):
                 player.is_alive = False
                 self._decrease_lives(player)
                 return True
         return False
 
+    def _check_weapon_ball_collision(self, bubble, is_ball, player):
+        if self.collision == ANALYTIC:
+            return player.weapon.is_active and \
+                collide_harpoon(bubble, is_ball, player.weapon)
+        return pygame.sprite.collide_rect(bubble, player.weapon) \
+            and player.weapon.is_active
+
+    def _check_player_ball_collision(self, bubble, is_ball, player):
+        if self.collision == ANALYTIC:
+            return collide_bubble(bubble, is_ball, player)
+        return pygame.sprite.collide_mask(bubble, player)
+
     def _check_for_bonus_collision(self, player):
         for bonus_index, bonus in enumerate(self.bonuses):
             if pygame.sprite.collide_mask(bonus, player):
@@ -201,19 +263,19 @@ class Game:
     def _restart(self):
         self.load_level(self.level)
 
-    @staticmethod
-    def _drop_bonus():
-        if random.randrange(BONUS_DROP_RATE) == 0:
-            bonus_type = random.choice(bonus_types)
+    def _drop_bonus(self):
+        if self.rng.randrange(BONUS_DROP_RATE) == 0:
+            bonus_type = self.rng.choice(bonus_types)
             return bonus_type
 
     def _activate_bonus(self, bonus, player):
         if bonus == BONUS_LIFE:
             player.lives += 1
         elif bonus == BONUS_TIME:
-            self.time_left += 10
+            self.clock.add_time(10)
 
     def _split_ball(self, ball_index):
+        self._release_bubble_arrays()
         ball = self.balls[ball_index]
         if ball.size > 1:
             self.balls.append(Ball(
@@ -231,6 +293,7 @@ class Game:
             self.bonuses.append(bonus)
 
     def _split_hexagon(self, hex_index):
+        self._release_bubble_arrays()
         hexagon = self.hexagons[hex_index]
         if hexagon.size > 1:
             self.hexagons.append(
@@ -246,6 +309,35 @@ class Game:
                           bonus_type)
             self.bonuses.append(bonus)
 
+    def sync_bubbles(self):
+        """
+        writes the speeds of the bubbles moved by the bubble arrays into their
+        sprites, their rects are always current
+        """
+        if self.bubbles_in_arrays:
+            self.bubble_arrays.store_speeds()
+
+    def _release_bubble_arrays(self):
+        # The sprites become the state of the bubbles again, before they are added, removed or replaced
+        self.sync_bubbles()
+        self.bubbles_in_arrays = False
+
+    def _update_bubbles(self):
+        # Many bubbles are moved in one vectorized pass instead of a Sprite update per bubble, the arrays
+        # are loaded only when the bubbles change
+        if len(self.balls) + len(self.hexagons) >= self.physics_threshold:
+            if not self.bubbles_in_arrays:
+                self.bubble_arrays.load(self.balls, self.hexagons)
+                self.bubbles_in_arrays = True
+            self.bubble_arrays.step()
+            self.bubble_arrays.store_rects()
+        else:
+            self._release_bubble_arrays()
+            for ball in self.balls:
+                ball.update()
+            for hexagon in self.hexagons:
+                hexagon.update()
+
     def update(self):
         if self.level_completed:
             if  not self.is_completed:
@@ -253,40 +345,30 @@ class Game:
                 self.add_to_score(TIME_LEFT_SCORE_FACTOR * self.get_time_left())
             else:
                 self.is_running = False
+                self.save_progress()
 
         if self.game_over:
             self.is_running = False
+            self.save_progress()
             #pygame.quit()
             #sys.exit()
         if self.dead_player:
             self._restart()
+        self._tick()
         self._check_for_collisions()
-        for ball in self.balls:
-            ball.update()
-        for hexagon in self.hexagons:
-            hexagon.update()
+        self._update_bubbles()
         for player in self.players:
             player.update()
         for bonus in self.bonuses:
             bonus.update()
+        self._bubble_query = None
         if not self.balls and not self.hexagons:
             self.level_completed = True
             if self.level == self.max_level_available:
                 self.is_completed = True
 
-    def _timer(self, interval, worker_func, iterations=0):
-        if iterations and not self.dead_player and not \
-                self.level_completed and not self.is_restarted:
-            Timer(
-
-                interval, self._timer,
-                [interval, worker_func, 0 if iterations ==
-                    0 else iterations - 1]
-            ).start()
-            worker_func()
-
-    def _tick_second(self):
-        self.time_left -= 1
-        if self.time_left == 0:
+    def _tick(self):
+        # Advance the level clock by one frame, all players lose a life when the time runs out
+        if self.clock.tick():
             for player in self.players:
                 self._decrease_lives(player)
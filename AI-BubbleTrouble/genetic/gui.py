@@ -84,7 +84,6 @@ def start_level(level, game, font, clock, screen, main_menu, load_level_menu,tra
         #     pygame.time.delay(5)
         if game.is_restarted:
             game.is_restarted = False
-            game._start_timer()
         clock.tick(FPS)
 
 
@@ -120,6 +119,7 @@ def start_ai_level_menu(game, font, clock, screen, main_menu, load_level_menu):
     start_load_level_menu(game, font, clock, screen, main_menu, load_level_menu)
 
 def quit_game(game, font, clock, screen, main_menu, load_level_menu):
+    game.save_progress()
     pygame.quit()
     sys.exit()
 
@@ -0,0 +1,99 @@
+import json
+from collections import namedtuple
+
+import numpy as np
+
+from genetic.settings import *
+
+LEVELS_FILE = APP_PATH + 'levels.json'
+PROGRESS_FILE = APP_PATH + 'max_level_available'
+
+# Columns of the bubble arrays of a level template
+X, Y, SIZE, SPEED_X, SPEED_Y = range(5)
+
+# Immutable description of a level, balls and hexagons are read only int arrays with a
+# (x, y, size, speed x, speed y) row per bubble
+LevelTemplate = namedtuple('LevelTemplate', ('number', 'time', 'balls', 'hexagons'))
+
+_catalog = None
+_max_level_available = None
+
+
+def _parse_bubbles(level, key, bubbles):
+    rows = []
+    for bubble in bubbles:
+        try:
+            row = [bubble['x'], bubble['y'], bubble['size'], bubble['speed'][0], bubble['speed'][1]]
+        except (KeyError, IndexError, TypeError):
+            raise ValueError('Level {}: every bubble in {} needs x, y, size and speed'.format(level, key))
+        if len(bubble['speed']) != 2 or not all(isinstance(value, int) for value in row):
+            raise ValueError('Level {}: bubble {} in {} must have integer values'.format(level, bubble, key))
+        if not 1 <= row[SIZE] <= MAX_BALL_SIZE:
+            raise ValueError('Level {}: bubble size must be in [1, {}]'.format(level, MAX_BALL_SIZE))
+        if not (0 <= row[X] <= WINDOWWIDTH and 0 <= row[Y] <= WINDOWHEIGHT):
+            raise ValueError('Level {}: bubble {} is out of the window'.format(level, bubble))
+        rows.append(row)
+    array = np.array(rows, dtype=np.int64).reshape((-1, 5))
+    array.setflags(write=False)
+    return array
+
+
+def parse_levels(levels):
+    """
+    Validate the given levels description and compile it into level templates
+    :param levels: dict - the content of levels.json
+    :return: dict of level number to LevelTemplate
+    """
+    catalog = {}
+    for key, level in levels.items():
+        number = int(key)
+        if not isinstance(level.get('time'), int) or level['time'] <= 0:
+            raise ValueError('Level {}: time must be a positive integer'.format(number))
+        catalog[number] = LevelTemplate(number, level['time'],
+                                        _parse_bubbles(number, 'balls', level.get('balls', [])),
+                                        _parse_bubbles(number, 'hexagons', level.get('hexagons', [])))
+    if sorted(catalog) != list(range(1, len(catalog) + 1)):
+        raise ValueError('Levels must be numbered 1 to {}'.format(len(catalog)))
+    return catalog
+
+
+def get_catalog():
+    """
+    :return: dict of level number to LevelTemplate, levels.json is parsed once per process
+    """
+    global _catalog
+    if _catalog is None:
+        with open(LEVELS_FILE, 'r') as levels_file:
+            _catalog = parse_levels(json.load(levels_file))
+    return _catalog
+
+
+def get_level(number):
+    """
+    :return: LevelTemplate of the given level number
+    """
+    return get_catalog()[number]
+
+
+def get_max_level_available():
+    """
+    :return: the highest level reached so far, the progress file is read once per process
+    """
+    global _max_level_available
+    if _max_level_available is None:
+        with open(PROGRESS_FILE, 'r') as max_completed_level_file:
+            max_level_available = max_completed_level_file.read()
+            _max_level_available = int(max_level_available) if max_level_available else 1
+    return _max_level_available
+
+
+def save_max_level_available(level):
+    """
+    Persist the highest level reached so far, the file is written only when it changes
+    """
+    global _max_level_available
+    if level == get_max_level_available():
+        return
+    _max_level_available = level
+    with open(PROGRESS_FILE, 'w') as max_completed_level_file:
+        max_completed_level_file.write(str(level))
@@ -4,7 +4,8 @@ from weapon import *
 class Player(pygame.sprite.Sprite):
 
     def __init__(self, image_name='player.png'):
-        self.image = pygame.image.load(IMAGES_PATH + image_name)
+        self.image = get_image(image_name)
+        self.mask = get_mask(image_name)
         self.rect = self.image.get_rect()
         self.weapon = Weapon()
         self.moving_left = False
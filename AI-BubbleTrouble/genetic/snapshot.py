@@ -0,0 +1,112 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Columns of the bubble arrays of a snapshot, a (left, top, size, speed x, speed y) row per bubble
+LEFT, TOP, SIZE, SPEED_X, SPEED_Y = range(5)
+BUBBLE_COLUMNS = 5
+# Columns of the player arrays of a snapshot, a row per player
+PLAYER_LEFT, PLAYER_TOP, LIVES, IS_ALIVE, MOVING_LEFT, MOVING_RIGHT, WEAPON_ACTIVE, WEAPON_LEFT, WEAPON_TOP = range(9)
+PLAYER_COLUMNS = 9
+
+# State of a game without any Surface, every field is a small int array (or None) so a snapshot
+# is cheap to copy and to pickle. state holds the game's scalars in the order given by the game class
+GameSnapshot = namedtuple('GameSnapshot', ('state', 'balls', 'hexagons', 'players', 'bonuses', 'rng'))
+
+
+def pack_bubbles(bubbles):
+    """
+    :param bubbles: list of Bubble sprites
+    :return: int32 array with a row per bubble
+    """
+    array = np.empty((len(bubbles), BUBBLE_COLUMNS), dtype=np.int32)
+    for row, bubble in zip(array, bubbles):
+        row[:] = bubble.rect.left, bubble.rect.top, bubble.size, bubble.speed[0], bubble.speed[1]
+    return array
+
+
+def unpack_bubbles(array, bubble_class):
+    """
+    :param array: int array with a row per bubble, as returned by pack_bubbles
+    :param bubble_class: Ball or Hexagon
+    :return: list of new sprites of the given class
+    """
+    bubbles = []
+    for left, top, size, speed_x, speed_y in array.tolist():
+        bubble = bubble_class(0, 0, size, [speed_x, speed_y])
+        bubble.rect.topleft = left, top
+        bubbles.append(bubble)
+    return bubbles
+
+
+def pack_players(players):
+    """
+    :param players: list of Player sprites
+    :return: int32 array with a row per player
+    """
+    array = np.empty((len(players), PLAYER_COLUMNS), dtype=np.int32)
+    for row, player in zip(array, players):
+        weapon = player.weapon
+        row[:] = (player.rect.left, player.rect.top, player.lives, player.is_alive, player.moving_left,
+                  player.moving_right, weapon.is_active, weapon.rect.left, weapon.rect.top)
+    return array
+
+
+def unpack_players(array, players):
+    """
+    Write the given rows into the players in place, so references to the players stay valid
+    :param array: int array with a row per player, as returned by pack_players
+    :param players: list of Player sprites with the same length as the array
+    """
+    for row, player in zip(array.tolist(), players):
+        player.rect.topleft = row[PLAYER_LEFT], row[PLAYER_TOP]
+        player.lives = row[LIVES]
+        player.is_alive = bool(row[IS_ALIVE])
+        player.moving_left = bool(row[MOVING_LEFT])
+        player.moving_right = bool(row[MOVING_RIGHT])
+        player.weapon.is_active = bool(row[WEAPON_ACTIVE])
+        player.weapon.rect.topleft = row[WEAPON_LEFT], row[WEAPON_TOP]
+
+
+def pack_bonuses(bonuses, types):
+    """
+    :param bonuses: list of Bonus sprites
+    :param types: list of the bonus types, a bonus is stored by the index of its type
+    :return: int32 array with a (left, top, type index) row per bonus
+    """
+    array = np.empty((len(bonuses), 3), dtype=np.int32)
+    for row, bonus in zip(array, bonuses):
+        row[:] = bonus.rect.left, bonus.rect.top, types.index(bonus.type)
+    return array
+
+
+def unpack_bonuses(array, bonus_class, types):
+    """
+    :param array: int array with a row per bonus, as returned by pack_bonuses
+    :param bonus_class: Bonus
+    :param types: list of the bonus types given to pack_bonuses
+    :return: list of new bonus sprites
+    """
+    bonuses = []
+    for left, top, type_index in array.tolist():
+        bonus = bonus_class(0, 0, types[type_index])
+        bonus.rect.topleft = left, top
+        bonuses.append(bonus)
+    return bonuses
+
+
+def pack_rng(rng):
+    """
+    :param rng: random.Random
+    :return: uint32 array with the Mersenne Twister state of the generator
+    """
+    version, internal_state, gauss_next = rng.getstate()
+    return np.array(internal_state, dtype=np.uint32)
+
+
+def unpack_rng(array, rng):
+    """
+    :param array: uint32 array returned by pack_rng
+    :param rng: random.Random - set in place to the state of the array
+    """
+    rng.setstate((3, tuple(array.tolist()), None))
@@ -0,0 +1,101 @@
+import numpy as np
+
+# Axes of the distance queries, None is the euclidean distance
+AXIS_X = 0
+AXIS_Y = 1
+
+
+class BubbleQuery:
+    """
+    Spatial queries of the bubbles of a game around a player.
+    The centers of the bubbles are read into arrays once and every query is vectorized over them, so the
+    query holds for the frame it was built in. All the distances are between the center of the player
+    and the centers of the bubbles
+    """
+
+    def __init__(self, bubbles, player):
+        """
+        :param bubbles: list of the bubbles, the balls of the game followed by its hexagons
+        :param player: Player
+        """
+        self.bubbles = bubbles
+        offsets = np.array([bubble.rect.center for bubble in bubbles], dtype=np.int64).reshape((-1, 2))
+        offsets -= player.rect.center
+        np.abs(offsets, out=offsets)
+        self.distance_x = offsets[:, 0]
+        self.distance_y = offsets[:, 1]
+        # The euclidean queries compare the exact squared distances
+        self.squared_distance = self.distance_x * self.distance_x + self.distance_y * self.distance_y
+        self._distance = None
+
+    @classmethod
+    def from_game(cls, game, player_index=0):
+        """
+        :param game: Game
+        :param player_index: index of the player the distances are from
+        :return: BubbleQuery of the balls and hexagons of the game
+        """
+        return cls(game.balls + game.hexagons, game.players[player_index])
+
+    def __len__(self):
+        return len(self.bubbles)
+
+    def distances(self, axis=None):
+        """
+        :param axis: AXIS_X, AXIS_Y or None for the euclidean distance
+        :return: array of the distances of all the bubbles, in the order of the bubbles
+        """
+        if axis == AXIS_X:
+            return self.distance_x
+        if axis == AXIS_Y:
+            return self.distance_y
+        if self._distance is None:
+            self._distance = np.sqrt(self.squared_distance)
+        return self._distance
+
+    def _keys(self, axis):
+        return self.squared_distance if axis is None else self.distances(axis)
+
+    def closest(self, axis=None):
+        """
+        :param axis: AXIS_X, AXIS_Y or None for the euclidean distance
+        :return: the closest bubble and its distance, (None, 0) if there are no bubbles.
+        Of bubbles at the same distance the first one is returned
+        """
+        if not self.bubbles:
+            return None, 0
+        index = int(np.argmin(self._keys(axis)))
+        return self.bubbles[index], self.distances(axis)[index].item()
+
+    def farthest(self, axis=None):
+        """
+        :param axis: AXIS_X, AXIS_Y or None for the euclidean distance
+        :return: the farthest bubble and its distance, (None, 0) if there are no bubbles.
+        Of bubbles at the same distance the first one is returned
+        """
+        if not self.bubbles:
+            return None, 0
+        index = int(np.argmax(self._keys(axis)))
+        return self.bubbles[index], self.distances(axis)[index].item()
+
+    def nearest(self, k, axis=None):
+        """
+        :param k: int - number of bubbles
+        :param axis: AXIS_X, AXIS_Y or None for the euclidean distance
+        :return: list of the (bubble, distance) of the k closest bubbles, closest first
+        """
+        distances = self.distances(axis)
+        order = np.argsort(self._keys(axis), kind='stable')[:k]
+        return [(self.bubbles[index], distances[index].item()) for index in order]
+
+    def within_radius(self, radius, axis=None):
+        """
+        :param radius: largest distance of a returned bubble
+        :param axis: AXIS_X, AXIS_Y or None for the euclidean distance
+        :return: list of the bubbles at most radius away, in the order of the bubbles
+        """
+        if axis is None:
+            inside = self.squared_distance <= radius * radius
+        else:
+            inside = self.distances(axis) <= radius
+        return [self.bubbles[index] for index in np.flatnonzero(inside)]